@@ -0,0 +1,90 @@
+import binascii
+import re
+import uuid
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+DATA_URL = re.compile(r'^data:image/[\w.+-]+;base64,')
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+# Кратно 4 символам, чтобы каждый кусок декодировался отдельно.
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """
+    Картинка в формате data URL (base64).
+    Декодируется по частям во временный файл, размер файла и картинки
+    проверяется до полного декодирования изображения.
+    Ссылки (http...) пропускаются, чтобы при обновлении рецепта
+    можно было не передавать картинку заново.
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректную картинку в формате base64.',
+        'max_size': 'Размер картинки не должен превышать {max_size} байт.',
+        'max_pixels': ('Картинка не должна содержать '
+                       'больше {max_pixels} пикселей.'),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        match = DATA_URL.match(data) if isinstance(data, str) else None
+        if match is None:
+            self.fail('invalid_image')
+
+        payload_size = len(data) - match.end()
+        size = payload_size // 4 * 3 - data[-2:].count('=')
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+
+        image_file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            for start in range(match.end(), len(data), CHUNK_SIZE):
+                image_file.write(
+                    b64decode(data[start:start + CHUNK_SIZE], validate=True))
+            image_format = self.verify_image(image_file)
+        except (binascii.Error, ValueError, OSError,
+                UnidentifiedImageError, Image.DecompressionBombError):
+            image_file.close()
+            self.fail('invalid_image')
+        except serializers.ValidationError:
+            image_file.close()
+            raise
+
+        image_file.seek(0, 2)
+        size = image_file.tell()
+        image_file.seek(0)
+        return UploadedFile(
+            file=image_file,
+            name=f'{uuid.uuid4().hex}.{IMAGE_EXTENSIONS[image_format]}',
+            content_type=Image.MIME[image_format],
+            size=size,
+        )
+
+    def verify_image(self, image_file):
+        """
+        Проверить картинку, не декодируя ее целиком: размеры читаются
+        из заголовка, JPEG декодируется в уменьшенном масштабе (draft),
+        остальные форматы проверяются без декодирования пикселей.
+        """
+        image_file.seek(0)
+        image = Image.open(image_file)
+        if image.format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_image')
+        if image.width * image.height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('max_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+
+        if image.format == 'JPEG':
+            image.draft('RGB', (image.width // 8, image.height // 8))
+            image.load()
+        else:
+            image.verify()
+        return image.format
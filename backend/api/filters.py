@@ -1,7 +1,10 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.cache import get_tag_ids_by_slug
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingList
+from recipes.search import search_recipes
 
 
 class IngredientFilter(SearchFilter):
@@ -14,26 +17,59 @@ class IngredientFilter(SearchFilter):
         fields = ('name',)
 
 
+ORDERING_CHOICES = (
+    ('popular', 'Популярные'),
+    ('trending', 'Популярные за последнее время'),
+    ('cooking_time', 'По времени приготовления'),
+)
+
+RECIPE_ORDERINGS = {
+    'popular': ('-score__popular', '-id'),
+    'trending': ('-score__trending', '-id'),
+    'cooking_time': ('cooking_time', 'id'),
+}
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
+
+
 class RecipeFilter(filters.FilterSet):
-    """Фильтр для рецептов"""
-    tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
-                                             to_field_name='slug',
-                                             queryset=Tag.objects.all())
+    """
+    Фильтр для рецептов.
+    Все фильтры - подзапросы EXISTS, поэтому рецепты не дублируются.
+    """
+    tags = filters.MultipleChoiceFilter(choices=tag_choices,
+                                        method='tags_filter')
     is_favorited = filters.BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter')
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(choices=ORDERING_CHOICES,
+                                    method='ordering_filter')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_favorited')
 
+    def tags_filter(self, queryset, name, value):
+        """Фильтр по слагам тегов"""
+        tag_ids = get_tag_ids_by_slug()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value]
+            )
+        ))
+
     def is_favorited_filter(self, queryset, name, value):
         """Фильтр для избранного"""
         user = self.request.user
         if not user.is_authenticated:
             return queryset.none()
         if value:
-            return queryset.filter(favorite_recipes__user=user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=user, recipe_id=OuterRef('pk'))))
         return queryset
 
     def is_in_shopping_cart_filter(self, queryset, name, value):
@@ -42,5 +78,22 @@ class RecipeFilter(filters.FilterSet):
         if not user.is_authenticated:
             return queryset.none()
         if value:
-            return queryset.filter(shopping_lists__user=user)
+            return queryset.filter(Exists(ShoppingList.objects.filter(
+                user=user, recipe_id=OuterRef('pk'))))
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию, описанию и ингредиентам.
+        Явная сортировка через ordering заменяет сортировку по релевантности.
+        """
+        return search_recipes(queryset, value)
+
+    def ordering_filter(self, queryset, name, value):
+        """
+        Сортировка по предрасчитанной популярности
+        или по времени приготовления.
+        """
+        if value in ('popular', 'trending'):
+            queryset = queryset.filter(score__isnull=False)
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
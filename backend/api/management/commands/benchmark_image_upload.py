@@ -0,0 +1,54 @@
+import os
+import tracemalloc
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from drf_base64.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import StreamingBase64ImageField
+
+
+class Command(BaseCommand):
+    help = ('Сравнить пиковое потребление памяти при одновременной '
+            'загрузке картинок в base64')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=4)
+        parser.add_argument('--size-mb', type=int, default=10)
+
+    def make_payload(self, size_mb):
+        side = int((size_mb * 1024 * 1024 * 0.99 / 3) ** 0.5)
+        buffer = BytesIO()
+        Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3)
+        ).save(buffer, 'PNG')
+        return 'data:image/png;base64,' + b64encode(
+            buffer.getvalue()).decode(), len(buffer.getvalue())
+
+    def measure(self, field, payload, uploads):
+        def upload(_):
+            image_file = field.run_validation(payload)
+            image_file.close()
+
+        tracemalloc.start()
+        with ThreadPoolExecutor(max_workers=uploads) as executor:
+            list(executor.map(upload, range(uploads)))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    def handle(self, *args, **options):
+        uploads = options['uploads']
+        payload, size = self.make_payload(options['size_mb'])
+        self.stdout.write(
+            f'Загрузок: {uploads}, размер картинки: {size / 2 ** 20:.1f} МБ')
+
+        for name, field in (
+            ('drf_base64.Base64ImageField', Base64ImageField()),
+            ('StreamingBase64ImageField', StreamingBase64ImageField()),
+        ):
+            peak = self.measure(field, payload, uploads)
+            self.stdout.write(f'{name}: пик {peak / 2 ** 20:.1f} МБ')
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+
+class Command(BaseCommand):
+    help = ('Сравнить скорость поиска ингредиентов по индексу в памяти '
+            'и запросом к БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, search, queries, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                search(query)
+        return (time.perf_counter() - started) / (repeat * len(queries))
+
+    def handle(self, *args, **options):
+        names = Ingredient.objects.values_list('name', flat=True)[:50]
+        queries = [name[:length] for name in names for length in (1, 2, 3)]
+        if not queries:
+            self.stdout.write(self.style.WARNING('Нет ингредиентов в базе'))
+            return
+
+        def database_search(query):
+            return list(Ingredient.objects.filter(
+                name__istartswith=query
+            ).values('id', 'name', 'measurement_unit'))
+
+        ingredient_index.get_snapshot()
+        repeat = options['repeat']
+        database_time = self.measure(database_search, queries, repeat)
+        index_time = self.measure(ingredient_index.search, queries, repeat)
+
+        self.stdout.write(
+            f'Запросов: {len(queries)}, повторов: {repeat}\n'
+            f'БД: {database_time * 1000:.3f} мс на запрос\n'
+            f'Индекс: {index_time * 1000:.3f} мс на запрос'
+        )
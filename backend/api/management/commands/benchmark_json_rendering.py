@@ -0,0 +1,100 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeSerializer, SubscriptionSerializer
+from recipes.models import Ingredient, IngredientInRecipes, Recipe, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время и объем выделяемой памяти при выводе '
+            'рецептов и подписок в JSON стандартным рендерером и '
+            'рендерером на orjson. Тестовые данные создаются в '
+            'транзакции, которая откатывается по завершении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=10)
+        parser.add_argument('--recipes-limit', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def seed(self, limit, ingredients_count):
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'benchmark-{i}')
+            for i in range(3)
+        ]
+        names = [f'Ингредиент {i}' for i in range(ingredients_count)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in names)
+        ingredients = list(Ingredient.objects.filter(name__in=names))
+        authors = []
+        for i in range(limit):
+            author = User.objects.create_user(
+                username=f'benchmark{i}', email=f'benchmark{i}@example.com',
+                first_name='Повар', last_name=f'Номер {i}')
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', cooking_time=30,
+                image='app/benchmark.png',
+                text='Нарезать, смешать, посолить и подавать горячим. ' * 5)
+            recipe.tags.set(tags)
+            IngredientInRecipes.objects.bulk_create(
+                IngredientInRecipes(recipe=recipe, ingredient=ingredient,
+                                    amount=100 + i)
+                for ingredient in ingredients
+            )
+            authors.append(author)
+        return authors
+
+    def get_payloads(self, authors, recipes_limit):
+        request = Request(APIRequestFactory().get(
+            '/api/', {'recipes_limit': recipes_limit}))
+        request.user = authors[0]
+        context = {'request': request}
+        recipes = Recipe.objects.listing().filter(author__in=authors)
+        return {
+            'рецепты': RecipeSerializer(
+                recipes, many=True, context=context).data,
+            'подписки': SubscriptionSerializer(
+                authors, many=True, context=context).data,
+        }
+
+    def measure(self, renderer, data, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            rendered = renderer.render(data)
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+
+        tracemalloc.start()
+        renderer.render(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak, len(rendered)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson не установлен.')
+        with transaction.atomic():
+            authors = self.seed(options['limit'], options['ingredients'])
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                payloads = self.get_payloads(
+                    authors, options['recipes_limit'])
+            transaction.set_rollback(True)
+
+        for name, data in payloads.items():
+            for renderer in (JSONRenderer(), FastJSONRenderer()):
+                elapsed, peak, size = self.measure(
+                    renderer, data, options['repeat'])
+                self.stdout.write(
+                    f'{name}, {type(renderer).__name__}: {elapsed:.3f} мс, '
+                    f'память {peak / 1024:.1f} КБ, ответ {size / 1024:.1f} КБ')
@@ -0,0 +1,109 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import RecipeSerializer, SubscriptionSerializer
+from recipes.models import Ingredient, IngredientInRecipes, Recipe, Tag
+from users.models import Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время вывода страниц рецептов и подписок полями DRF '
+            'и быстрым выводом списков. Тестовые данные создаются в '
+            'транзакции, которая откатывается по завершении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=10)
+        parser.add_argument('--recipes-limit', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def seed(self, limit, ingredients_count, recipes_limit):
+        reader = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com')
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'benchmark-{i}')
+            for i in range(3)
+        ]
+        names = [f'Ингредиент {i}' for i in range(ingredients_count)]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in names)
+        ingredients = list(Ingredient.objects.filter(name__in=names))
+        authors = []
+        for i in range(limit):
+            author = User.objects.create_user(
+                username=f'benchmark{i}', email=f'benchmark{i}@example.com',
+                first_name='Повар', last_name=f'Номер {i}')
+            Subscription.objects.create(user=reader, author=author)
+            for j in range(recipes_limit):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {i}-{j}', cooking_time=30,
+                    image='app/benchmark.png',
+                    text='Нарезать, смешать, посолить и подавать. ' * 5)
+                recipe.tags.set(tags)
+                IngredientInRecipes.objects.bulk_create(
+                    IngredientInRecipes(recipe=recipe, ingredient=ingredient,
+                                        amount=100 + i)
+                    for ingredient in ingredients
+                )
+            authors.append(author)
+        return reader, authors
+
+    def measure(self, render, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        repeat = options['repeat']
+        with transaction.atomic(), override_settings(
+                ALLOWED_HOSTS=['testserver']):
+            reader, authors = self.seed(
+                limit, options['ingredients'], options['recipes_limit'])
+            request = Request(APIRequestFactory().get(
+                '/api/', {'recipes_limit': options['recipes_limit']}))
+            request.user = reader
+            recipes = list(Recipe.objects.listing().filter(
+                author__in=authors)[:limit])
+            for author in authors:
+                author.limited_recipes = [
+                    recipe for recipe in recipes
+                    if recipe.author_id == author.pk
+                ]
+
+            recipe_serializer = RecipeSerializer(
+                recipes, many=True, context={'request': request}).child
+            subscription_serializer = SubscriptionSerializer(
+                authors, many=True, context={'request': request}).child
+            cases = (
+                ('рецепты', recipes,
+                 recipe_serializer.to_representation,
+                 lambda recipe: recipe_serializer.add_user_fields(
+                     recipe_serializer.get_fragment(recipe), recipe)),
+                ('подписки', authors,
+                 subscription_serializer.to_representation,
+                 subscription_serializer.fast_representation),
+            )
+            for name, instances, drf, fast in cases:
+                drf_time = self.measure(
+                    lambda: [drf(instance) for instance in instances],
+                    repeat)
+                fast_time = self.measure(
+                    lambda: [fast(instance) for instance in instances],
+                    repeat)
+                self.stdout.write(
+                    f'{name}, {len(instances)} на странице: '
+                    f'DRF {drf_time:.1f} мс, '
+                    f'быстрый вывод {fast_time:.1f} мс')
+
+            transaction.set_rollback(True)
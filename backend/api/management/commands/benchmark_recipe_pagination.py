@@ -0,0 +1,65 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.pagination import RecipePagination
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время выдачи глубоких страниц рецептов по номеру '
+            'страницы и по курсору. Тестовые рецепты создаются в '
+            'транзакции, которая откатывается по завершении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1_000_000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def seed(self, count, batch_size):
+        author = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com')
+        for start in range(0, count, batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(author=author, name=f'Рецепт {i}', text='Текст',
+                       cooking_time=10, image='app/benchmark.png')
+                for i in range(start, min(start + batch_size, count))
+            )
+
+    def measure(self, params):
+        request = Request(APIRequestFactory().get('/api/recipes/', params))
+        paginator = RecipePagination()
+        started = time.perf_counter()
+        paginator.paginate_queryset(Recipe.objects.all(), request)
+        return (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        count = options['recipes']
+        limit = options['limit']
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed(count, options['batch_size'])
+            self.stdout.write(
+                f'Создано рецептов: {count} '
+                f'за {time.perf_counter() - started:.1f} с')
+
+            paginator = RecipePagination()
+            for depth in (0.01, 0.5, 0.99):
+                offset = int(count * depth) // limit * limit
+                position = Recipe.objects.all()[offset]
+                cursor = paginator.encode_cursor(position, False)
+                page_time = self.measure(
+                    {'limit': limit, 'page': offset // limit + 1})
+                cursor_time = self.measure(
+                    {'limit': limit, 'cursor': cursor})
+                self.stdout.write(
+                    f'Глубина {depth:.0%}: по номеру {page_time:.1f} мс, '
+                    f'по курсору {cursor_time:.1f} мс')
+
+            transaction.set_rollback(True)
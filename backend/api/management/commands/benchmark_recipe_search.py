@@ -0,0 +1,112 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.models import Ingredient, IngredientInRecipes, Recipe
+from recipes.search import search_recipes, update_search_vectors
+
+User = get_user_model()
+
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'соус', 'запеканка', 'котлеты',
+    'варить', 'жарить', 'запечь', 'тушить', 'нарезать', 'смешать',
+    'посолить', 'добавить', 'подавать', 'горячим', 'холодным', 'быстро',
+    'медленно', 'духовке', 'сковороде', 'кастрюле', 'минут', 'огне',
+    'масло', 'мука', 'яйца', 'молоко', 'сахар', 'лук', 'морковь',
+    'картофель', 'капуста', 'свекла', 'чеснок', 'перец', 'зелень',
+)
+INGREDIENTS = ('Соль', 'Сахар', 'Мука', 'Лук', 'Морковь', 'Свекла',
+               'Картофель', 'Говядина', 'Курица', 'Рис')
+RARE_WORD = 'трюфель'
+
+
+class Command(BaseCommand):
+    help = ('Сравнить время полнотекстового поиска рецептов и поиска '
+            'через ILIKE. Тестовые рецепты создаются в транзакции, '
+            'которая откатывается по завершении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def seed(self, count, batch_size):
+        author = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com')
+        ingredients = [
+            Ingredient.objects.get_or_create(
+                name=name, measurement_unit='г')[0]
+            for name in INGREDIENTS
+        ]
+        words = random.Random(0)
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f'{words.choice(WORDS).capitalize()} {i}',
+                    text=' '.join(
+                        words.choices(WORDS, k=12)
+                        + ([RARE_WORD] if i % 1000 == 0 else [])),
+                    cooking_time=10,
+                    image='app/benchmark.png'
+                )
+                for i in range(start, stop)
+            )
+            if recipes[0].pk is None:
+                recipes = Recipe.objects.filter(
+                    author=author).order_by('-id')[:stop - start]
+            IngredientInRecipes.objects.bulk_create(
+                IngredientInRecipes(recipe=recipe, ingredient=ingredient,
+                                    amount=1)
+                for recipe in recipes
+                for ingredient in words.sample(ingredients, 3)
+            )
+
+    def measure(self, get_queryset, limit, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = get_queryset()
+            list(queryset[:limit])
+            queryset.count()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    def handle(self, *args, **options):
+        count = options['recipes']
+        limit = options['limit']
+        repeat = options['repeat']
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed(count, options['batch_size'])
+            update_search_vectors(Recipe.objects.all())
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            self.stdout.write(
+                f'Создано рецептов: {count} '
+                f'за {time.perf_counter() - started:.1f} с')
+
+            for query in (RARE_WORD, 'свекла', 'суп свекла'):
+                words = query.split()
+                search_time = self.measure(
+                    lambda: search_recipes(Recipe.objects.all(), query),
+                    limit, repeat)
+                ilike_filter = Q()
+                for word in words:
+                    ilike_filter &= (Q(name__icontains=word)
+                                     | Q(text__icontains=word))
+                ilike_time = self.measure(
+                    lambda: Recipe.objects.filter(ilike_filter),
+                    limit, repeat)
+                self.stdout.write(
+                    f'"{query}": полнотекстовый поиск {search_time:.1f} мс, '
+                    f'ILIKE {ilike_time:.1f} мс')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+
+
+class Command(BaseCommand):
+    help = ('Вывести планы запросов (EXPLAIN ANALYZE в PostgreSQL) '
+            'для основных эндпоинтов API. Запросы выполняются от имени '
+            'пользователя --user, кэш на время выполнения отключается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, по умолчанию первый пользователь')
+
+    def get_endpoints(self):
+        tag = Tag.objects.first()
+        recipe = Recipe.objects.first()
+        ingredient = Ingredient.objects.first()
+        endpoints = [
+            ('Список рецептов', reverse('recipes-list'), {}),
+            ('Список рецептов по курсору', reverse('recipes-list'),
+             {'cursor': ''}),
+            ('Избранное и список покупок', reverse('recipes-list'),
+             {'is_favorited': 1, 'is_in_shopping_cart': 1}),
+            ('Подписки', reverse('users-subscriptions'),
+             {'recipes_limit': 3}),
+            ('Скачивание списка покупок',
+             reverse('recipes-download-shopping-cart'), {}),
+            ('Пользователи', reverse('users-list'), {}),
+        ]
+        if tag is not None:
+            endpoints.append(('Рецепты по тегу', reverse('recipes-list'),
+                              {'tags': tag.slug}))
+        if recipe is not None:
+            endpoints.append(('Рецепт', reverse(
+                'recipes-detail', args=(recipe.id,)), {}))
+        if ingredient is not None:
+            endpoints.append(('Ингредиенты', reverse('ingredients-list'),
+                              {'name': ingredient.name[:2]}))
+        return endpoints
+
+    def explain(self, sql, params=()):
+        if connection.vendor == 'postgresql':
+            prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+        elif connection.vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('Пользователь не найден')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        with override_settings(ALLOWED_HOSTS=['testserver'],
+                               CACHES=DUMMY_CACHES):
+            for title, url, params in self.get_endpoints():
+                with CaptureQueriesContext(connection) as context:
+                    response = client.get(url, params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{title}: GET {url} {params or ""} '
+                    f'-> {response.status_code}'))
+                for query in context.captured_queries:
+                    if not query['sql'].startswith('SELECT'):
+                        continue
+                    self.stdout.write(self.style.SQL_KEYWORD(query['sql']))
+                    self.stdout.write(self.explain(query['sql']) + '\n')
+
+        ingredient = Ingredient.objects.first()
+        if ingredient is not None:
+            queryset = Ingredient.objects.filter(
+                name__istartswith=ingredient.name[:2])
+            sql, params = queryset.query.sql_with_params()
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Поиск ингредиентов по началу названия в БД'))
+            self.stdout.write(self.style.SQL_KEYWORD(sql % params))
+            self.stdout.write(self.explain(sql, params) + '\n')
@@ -0,0 +1,35 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.cache import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Показать количество попаданий и промахов кэша ответов '
+            'с рецептами для анонимных пользователей. Статистика '
+            'хранится в кэше, поэтому нужен общий для процессов '
+            'CACHE_BACKEND, например memcached или файловый кэш.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='recipes')
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить статистику после вывода.')
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise CommandError(
+                'Кэш в памяти процесса недоступен команде: статистика '
+                'собирается в процессе сервера. Укажите общий для '
+                'процессов CACHE_BACKEND, например memcached или '
+                'django.core.cache.backends.filebased.FileBasedCache.')
+        name = options['name']
+        stats = get_cache_stats(name)
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1f}%')
+        if options['reset']:
+            reset_cache_stats(name)
@@ -1,10 +1,109 @@
-from rest_framework import viewsets
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from rest_framework import status, viewsets
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.response import Response
+
+from recipes.cache import count_cache_access, get_version
 
 
 class TagIngredientMixin(ListModelMixin, RetrieveModelMixin,
                          viewsets.GenericViewSet):
     """
     Миксин для работы с моделями - Tag и Ingredient.
+    Ответы кэшируются по версии справочника, заданного в reference_name,
+    и снабжаются заголовками ETag и Last-Modified.
+    """
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(TagIngredientMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(TagIngredientMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    def cached_response(self, request, get_response):
+        version = get_version(self.reference_name)
+        etag = f'"{self.reference_name}-{version}"'
+        last_modified = version // 10 ** 9
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'foodgram:{self.reference_name}:{version}:{path}'
+        data = cache.get(key)
+        if data is None:
+            response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class AnonymousCacheMixin:
+    """
+    Миксин для кэширования ответов list и retrieve анонимным
+    пользователям. Ответы хранятся по версии данных, заданных
+    в cache_version_name, и нормализованным параметрам запроса.
     """
-    pass
+    cache_version_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_cached_response(
+            request, lambda: super(AnonymousCacheMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_cached_response(
+            request, lambda: super(AnonymousCacheMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    def get_cache_key(self, request, version):
+        """
+        Ключ ответа: адрес без учета порядка параметров запроса.
+        Хост входит в ключ, так как ответ содержит абсолютные ссылки.
+        """
+        params = urlencode(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        ))
+        url = f'{request.build_absolute_uri(request.path)}?{params}'
+        digest = hashlib.md5(url.encode()).hexdigest()
+        return f'foodgram:{self.cache_version_name}:{version}:{digest}'
+
+    def anonymous_cached_response(self, request, get_response):
+        if request.user.is_authenticated:
+            return get_response()
+
+        key = self.get_cache_key(
+            request, get_version(self.cache_version_name))
+        data = cache.get(key)
+        count_cache_access(self.cache_version_name, data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data,
+                      settings.ANONYMOUS_RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -1,7 +1,212 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     """Кастомный пагинатор"""
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор Django, который хранит количество объектов в кэше,
+    а для больших выборок в PostgreSQL берет оценку планировщика
+    вместо точного COUNT(*).
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        cached = cache.get(self.count_key) if self.count_key else None
+        if cached is None:
+            cached = self.get_count()
+            if self.count_key:
+                cache.set(self.count_key, cached,
+                          settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        count, self.count_exact = cached
+        return count
+
+    def get_count(self):
+        """Количество объектов и признак того, что оно точное."""
+        estimate = self.estimate_count()
+        if (estimate is not None
+                and estimate > settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD):
+            return estimate, False
+        return self.object_list.count(), True
+
+    def estimate_count(self):
+        """Оценка количества строк по плану запроса PostgreSQL."""
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+
+class CachedCountPagination(CustomPagination):
+    """
+    Постраничный вывод с кэшируемым количеством объектов.
+    Количество кэшируется для пути, пользователя и параметров фильтрации,
+    признак точности количества отдается в поле count_exact.
+    """
+    count_ignored_params = ('page', 'limit', 'cursor')
+
+    def get_count_key(self, request):
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists()
+            if key not in self.count_ignored_params for value in values
+        )
+        digest = hashlib.md5(
+            json.dumps((request.path, params)).encode()).hexdigest()
+        return f'foodgram:count:{request.user.id}:{digest}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CachedCountPaginator, count_key=self.get_count_key(request))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('count', self.page.paginator.count),
+            ('count_exact', self.page.paginator.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+
+class RecipePagination(CachedCountPagination):
+    """
+    Пагинатор для рецептов.
+    С параметром cursor (для первой страницы - пустым) страницы
+    отдаются по ключу сортировки (-pub_date, name, id) без OFFSET
+    и без подсчета общего количества рецептов. Курсор не сочетается
+    с параметрами ordering и search: их порядок заменил бы ключ курсора.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    search_query_param = 'search'
+    invalid_cursor_message = 'Неверный курсор.'
+    cursor_ordering_message = (
+        'Курсор поддерживается только для сортировки по дате публикации.')
+    cursor_search_message = (
+        'Курсор не поддерживается при поиске, используйте limit и page.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        if request.query_params.get(self.ordering_query_param):
+            raise ValidationError(
+                {self.cursor_query_param: self.cursor_ordering_message})
+        if request.query_params.get(self.search_query_param):
+            raise ValidationError(
+                {self.cursor_query_param: self.cursor_search_message})
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        reverse = cursor is not None and cursor['reverse']
+
+        if cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(cursor))
+        ordering = (('pub_date', '-name', '-id') if reverse
+                    else ('-pub_date', 'name', 'id'))
+        results = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results and (has_more or reverse):
+            self.next_position = results[-1]
+        if results and (has_more if reverse else cursor is not None):
+            self.previous_position = results[0]
+        return results
+
+    def get_position_filter(self, cursor):
+        """
+        Рецепты после (или до, для обратного курсора) позиции курсора.
+        Условие на pub_date без OR позволяет начать чтение индекса
+        сразу с позиции курсора.
+        """
+        pub_date, name, pk = cursor['pub_date'], cursor['name'], cursor['id']
+        if cursor['reverse']:
+            return Q(pub_date__gte=pub_date) & (
+                Q(pub_date__gt=pub_date)
+                | Q(pub_date=pub_date, name__lt=name)
+                | Q(pub_date=pub_date, name=name, id__lt=pk))
+        return Q(pub_date__lte=pub_date) & (
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, name__gt=name)
+            | Q(pub_date=pub_date, name=name, id__gt=pk))
+
+    def encode_cursor(self, recipe, reverse):
+        position = json.dumps(
+            (recipe.pub_date.isoformat(), recipe.name, recipe.id, reverse),
+            ensure_ascii=False)
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            pub_date, name, pk, reverse = json.loads(
+                urlsafe_b64decode(encoded.encode()).decode())
+            pub_date = parse_datetime(pub_date)
+        except (BinasciiError, UnicodeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None or not isinstance(pk, int):
+            raise NotFound(self.invalid_cursor_message)
+        return {'pub_date': pub_date, 'name': str(name), 'id': pk,
+                'reverse': bool(reverse)}
+
+    def get_cursor_link(self, recipe, reverse):
+        if recipe is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(recipe, reverse))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_cursor_link(self.next_position, False),
+            'previous': self.get_cursor_link(self.previous_position, True),
+            'results': data,
+        })
@@ -0,0 +1,50 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Рендерер для выгрузки в текстовом формате."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.get('detail', data)
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Рендерер для выгрузки в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Рендерер JSON на orjson. Без orjson, а также для JSON с отступами
+    (например, в браузерном API) используется стандартный рендерер.
+    Типы, которые orjson не поддерживает, и даты преобразуются
+    так же, как в стандартном рендерере.
+    """
+    default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data, default=self.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace(
+            '\u2029'.encode(), b'\\u2029')
@@ -1,18 +1,38 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, models, transaction
+from django.utils.functional import cached_property
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
-                            ShoppingList, Tag)
+from api.fields import StreamingBase64ImageField
+from recipes.cache import get_user_relations, get_version
+from recipes.models import Ingredient, IngredientInRecipes, Recipe, Tag
+from recipes.search import recipe_ingredient_index
 from users.models import Subscription
 
 User = get_user_model()
 
+RECIPE_NAME_EXISTS = 'Рецепт с таким названием уже существует у автора.'
+MAX_BULK_RECIPES = 100
+
+
+def get_request_relations(context):
+    """
+    Снимок связей текущего пользователя, загружается один раз за запрос
+    для всех сериализаторов, включая вложенных авторов.
+    """
+    request = context.get('request')
+    if request is None or not request.user.is_authenticated:
+        return None
+    if not hasattr(request, 'user_relations'):
+        request.user_relations = get_user_relations(request.user.pk)
+    return request.user_relations
+
 # Приложение users
 
 
@@ -52,11 +72,21 @@ class CustomUserSerializer(UserSerializer):
         return data
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user if request is not None else None
-        return (user is not None and user.is_authenticated
-                and Subscription.objects.filter(
-                    user=user, author=obj).exists())
+        if hasattr(obj, 'is_followed'):
+            return obj.is_followed
+        relations = get_request_relations(self.context)
+        return relations is not None and obj.pk in relations.following
+
+    def fast_representation(self, obj):
+        """Вывод пользователя без полей DRF для списков."""
+        return {
+            'id': obj.id,
+            'username': obj.username,
+            'first_name': obj.first_name,
+            'last_name': obj.last_name,
+            'email': obj.email,
+            'is_subscribed': self.get_is_subscribed(obj),
+        }
 
     class Meta:
         model = User
@@ -64,20 +94,47 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
 
+class SubscriptionListSerializer(serializers.ListSerializer):
+    """Список подписок без полей DRF."""
+
+    def to_representation(self, data):
+        authors = data.all() if isinstance(data, models.Manager) else data
+        return [self.child.fast_representation(author) for author in authors]
+
+
 class SubscriptionSerializer(CustomUserSerializer):
     """Сериализатор для подписки пользователей"""
     recipes = serializers.SerializerMethodField(method_name='get_recipes')
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count'
-    )
 
-    def get_recipes(self, obj):
-        author_recipes = Recipe.objects.filter(author=obj)
+    def get_author_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return obj.limited_recipes
 
+        author_recipes = Recipe.objects.filter(author=obj)
         if 'recipes_limit' in self.context.get('request').GET:
-            recipes_limit = self.context.get('request').GET['recipes_limit']
+            recipes_limit = self.context.get('request').GET[
+                'recipes_limit']
             author_recipes = author_recipes[:int(recipes_limit)]
+        return author_recipes
+
+    @cached_property
+    def small_recipe_serializer(self):
+        return SmallRecipeSerializer(
+            context={'request': self.context.get('request')})
+
+    def fast_representation(self, obj):
+        """Вывод подписки без полей DRF для списков."""
+        data = super().fast_representation(obj)
+        data['recipes'] = [
+            self.small_recipe_serializer.fast_representation(recipe)
+            for recipe in self.get_author_recipes(obj)
+        ]
+        data['recipes_count'] = obj.recipes_count
+        data['followers_count'] = obj.followers_count
+        return data
 
+    def get_recipes(self, obj):
+        author_recipes = self.get_author_recipes(obj)
         if author_recipes:
             serializer = SmallRecipeSerializer(
                 author_recipes,
@@ -88,13 +145,12 @@ class SubscriptionSerializer(CustomUserSerializer):
 
         return []
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
     class Meta:
         model = User
         fields = ('id', 'username', 'first_name', 'last_name', 'email',
-                  'is_subscribed', 'recipes', 'recipes_count')
+                  'is_subscribed', 'recipes', 'recipes_count',
+                  'followers_count')
+        list_serializer_class = SubscriptionListSerializer
 
 # Приложение recipes
 
@@ -102,6 +158,15 @@ class SubscriptionSerializer(CustomUserSerializer):
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с тегами."""
 
+    def fast_representation(self, obj):
+        """Вывод тега без полей DRF для списков."""
+        return {
+            'id': obj.id,
+            'name': obj.name,
+            'color': obj.color,
+            'slug': obj.slug,
+        }
+
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
@@ -117,20 +182,20 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class RecipeIngredientsSerializer(serializers.ModelSerializer):
     """Вложенный сериализатор для работы с ингредиентами GET запросы."""
-    id = serializers.SerializerMethodField(method_name='get_id')
-    name = serializers.SerializerMethodField(method_name='get_name')
-    measurement_unit = serializers.SerializerMethodField(
-        method_name='get_measurement_unit'
-    )
-
-    def get_id(self, obj):
-        return obj.ingredient.id
-
-    def get_name(self, obj):
-        return obj.ingredient.name
-
-    def get_measurement_unit(self, obj):
-        return obj.ingredient.measurement_unit
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit')
+
+    def fast_representation(self, obj):
+        """Вывод ингредиента рецепта без полей DRF для списков."""
+        ingredient = obj.ingredient
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+            'amount': obj.amount,
+        }
 
     class Meta:
         model = IngredientInRecipes
@@ -158,8 +223,104 @@ class CreateUpdateRecipeIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для чтения рецептов."""
+class RecipeImageSerializer(serializers.Serializer):
+    """
+    Ссылки на уменьшенные копии картинки рецепта.
+    Пока копии не созданы, отдается исходная картинка.
+    """
+    image_thumb = serializers.SerializerMethodField(
+        method_name='get_image_thumb'
+    )
+    image_srcset = serializers.SerializerMethodField(
+        method_name='get_image_srcset'
+    )
+
+    def get_thumbnail_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_url(self, obj):
+        """Ссылка на картинку, как у поля ImageField."""
+        if not obj.image:
+            return None
+        return self.get_thumbnail_url(obj.image.name)
+
+    def get_thumbnail_sizes(self, obj):
+        thumbnails = obj.thumbnails
+        if not obj.image or thumbnails.get('source') != obj.image.name:
+            return []
+        return sorted(thumbnails['sizes'].values(),
+                      key=lambda size: size['width'])
+
+    def get_image_thumb(self, obj):
+        sizes = self.get_thumbnail_sizes(obj)
+        if sizes:
+            return self.get_thumbnail_url(sizes[0]['name'])
+        if obj.image:
+            return self.get_thumbnail_url(obj.image.name)
+        return None
+
+    def get_image_srcset(self, obj):
+        sizes = self.get_thumbnail_sizes(obj)
+        if not sizes:
+            return None
+        return ', '.join(
+            f'{self.get_thumbnail_url(size["name"])} {size["width"]}w'
+            for size in sizes
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Список рецептов через кэш сериализованных рецептов: рецепты
+    берутся из кэша одним запросом, недостающие загружаются из БД
+    одним запросом со связанными данными. Отметки пользователя
+    и счетчики добавляются после.
+    """
+
+    def get_fragment_key(self, recipe, version):
+        """
+        Ключ рецепта: версия тегов, ингредиентов и авторов, дата
+        изменения рецепта и адрес сайта, так как ссылки абсолютные.
+        """
+        request = self.context.get('request')
+        site = request.build_absolute_uri('/') if request is not None else ''
+        return (f'foodgram:recipe-fragments:{version}:{site}:'
+                f'{recipe.pk}:{recipe.updated_at.timestamp()}')
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        version = get_version('recipe-fragments')
+        keys = {
+            recipe.pk: self.get_fragment_key(recipe, version)
+            for recipe in recipes
+        }
+        fragments = cache.get_many(keys.values())
+
+        missing = [pk for pk, key in keys.items() if key not in fragments]
+        if missing:
+            loaded = {}
+            for pk, recipe in Recipe.objects.listing().in_bulk(
+                    missing).items():
+                keys[pk] = self.get_fragment_key(recipe, version)
+                loaded[keys[pk]] = self.child.get_fragment(recipe)
+            cache.set_many(loaded, settings.RECIPE_FRAGMENT_CACHE_TIMEOUT)
+            fragments.update(loaded)
+
+        return [
+            self.child.add_user_fields(fragments[keys[recipe.pk]], recipe)
+            for recipe in recipes if keys[recipe.pk] in fragments
+        ]
+
+
+class RecipeSerializer(RecipeImageSerializer, serializers.ModelSerializer):
+    """
+    Сериализатор для чтения рецептов.
+    В списках рецепты без полей uncached_fields берутся из кэша.
+    """
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField(
@@ -173,28 +334,93 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
 
     def get_ingredients(self, obj):
-        ingredients = IngredientInRecipes.objects.filter(recipe=obj)
+        ingredients = obj.ingredient_amounts.all()
         serializer = RecipeIngredientsSerializer(ingredients, many=True)
 
         return serializer.data
 
     def get_is_favorited(self, obj):
-        return (
-            self.context['request'].user.is_authenticated
-            and Favorite.objects.filter(user=self.context['request'].user,
-                                        recipe=obj).exists()
-        )
+        relations = get_request_relations(self.context)
+        return relations is not None and obj.pk in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        return (
-            self.context['request'].user.is_authenticated
-            and ShoppingList.objects.filter(user=self.context['request'].user,
-                                            recipe=obj).exists()
-        )
+        relations = get_request_relations(self.context)
+        return relations is not None and obj.pk in relations.shopping_cart
+
+    uncached_fields = ('is_favorited', 'is_in_shopping_cart',
+                       'favorites_count', 'in_carts_count')
+
+    def get_fragment(self, instance):
+        """
+        Рецепт для кэша, собранный без полей DRF,
+        без полей uncached_fields.
+        """
+        ingredients_serializer = RecipeIngredientsSerializer()
+        values = {
+            'id': instance.id,
+            'image_thumb': self.get_image_thumb(instance),
+            'image_srcset': self.get_image_srcset(instance),
+            'author': self.fields['author'].fast_representation(
+                instance.author),
+            'tags': [
+                self.fields['tags'].child.fast_representation(tag)
+                for tag in instance.tags.all()
+            ],
+            'ingredients': [
+                ingredients_serializer.fast_representation(ingredient)
+                for ingredient in instance.ingredient_amounts.all()
+            ],
+            'name': instance.name,
+            'image': self.get_image_url(instance),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+        }
+        return {
+            name: values[name] for name in self.fields
+            if name not in self.uncached_fields
+        }
+
+    def add_user_fields(self, fragment, instance):
+        """
+        Рецепт из кэша с отметками пользователя и счетчиками.
+        Кэш общий для наследников, поэтому порядок полей берется
+        из сериализатора.
+        """
+        relations = get_request_relations(self.context)
+        data = {}
+        for name, field in self.fields.items():
+            if name in self.uncached_fields:
+                data[name] = field.to_representation(
+                    field.get_attribute(instance))
+            elif name == 'author':
+                data[name] = dict(
+                    fragment[name],
+                    is_subscribed=(
+                        relations is not None
+                        and instance.author_id in relations.following)
+                )
+            else:
+                data[name] = fragment[name]
+        return data
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'updated_at', 'thumbnails', 'search_vector')
+        list_serializer_class = RecipeListSerializer
+
+
+class RecipeCoverageSerializer(RecipeSerializer):
+    """
+    Сериализатор рецептов, подобранных по имеющимся ингредиентам:
+    доля имеющихся ингредиентов и количество недостающих.
+    """
+    coverage = serializers.FloatField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+    uncached_fields = RecipeSerializer.uncached_fields + (
+        'coverage', 'missing_count')
+
+    class Meta(RecipeSerializer.Meta):
+        pass
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
@@ -205,7 +431,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         many=True
     )
     ingredients = CreateUpdateRecipeIngredientsSerializer(many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     cooking_time = serializers.IntegerField(
         validators=(
             MinValueValidator(1, message='Не менее одной минуты'),
@@ -214,96 +440,183 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     )
 
     def validate(self, data):
-        author = self.context.get('request').user
-        name = data.get('name')
-        if Recipe.objects.filter(author=author, name=name).exists():
-            raise ValidationError(
-                {'name': ('Рецепт с таким названием уже'
-                          'существует для данного автора.')})
-
         tags = data.get('tags')
         if not tags:
             raise ValidationError({'tags': 'Обязательное поле.'})
         if len(tags) != len(set(tags)):
             raise ValidationError({'tags': 'Теги должны быть уникальными!'})
 
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = data.get('ingredients')
         if not ingredients:
             raise ValidationError({
                 'ingredients': 'Обязательное поле.'})
 
-        ingredient_list = []
-        for ingredient in ingredients:
-            if ingredient['id'] in ingredient_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиент повторяется.'})
-            ingredient_list.append(ingredient['id'])
+        ingredient_ids = {ingredient['id'] for ingredient in ingredients}
+        if len(ingredient_ids) != len(ingredients):
+            raise ValidationError(
+                {'ingredients': 'Ингредиент повторяется.'})
+
+        missing_ids = ingredient_ids.difference(
+            Ingredient.objects.filter(
+                pk__in=ingredient_ids).values_list('pk', flat=True))
+        if missing_ids:
+            raise ValidationError({
+                'ingredients': 'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, sorted(missing_ids))))})
         return data
 
+    def create_ingredients(self, recipe, ingredients):
+        IngredientInRecipes.objects.bulk_create(
+            IngredientInRecipes(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
+        # bulk_create не отправляет сигналы, индекс сбрасывается здесь.
+        transaction.on_commit(recipe_ingredient_index.invalidate)
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.ingredient_amounts.all()
+        }
+        created = []
+        updated = []
+        for ingredient in ingredients:
+            recipe_ingredient = current.pop(ingredient['id'], None)
+            if recipe_ingredient is None:
+                created.append(IngredientInRecipes(
+                    recipe=recipe,
+                    ingredient_id=ingredient['id'],
+                    amount=ingredient['amount']
+                ))
+            elif recipe_ingredient.amount != ingredient['amount']:
+                recipe_ingredient.amount = ingredient['amount']
+                updated.append(recipe_ingredient)
+
+        if current:
+            IngredientInRecipes.objects.filter(
+                recipe=recipe, ingredient_id__in=current).delete()
+        if updated:
+            IngredientInRecipes.objects.bulk_update(updated, ('amount',))
+        if created:
+            IngredientInRecipes.objects.bulk_create(created)
+            transaction.on_commit(recipe_ingredient_index.invalidate)
+
+    def check_name_exists(self, author, name, exclude_pk=None):
+        """
+        Ошибка валидации, если у автора уже есть рецепт с таким
+        названием: так обрабатывается нарушение уникальности
+        при одновременном сохранении, другие ошибки не скрываются.
+        """
+        if Recipe.objects.filter(author=author, name=name).exclude(
+                pk=exclude_pk).exists():
+            raise ValidationError({'name': RECIPE_NAME_EXISTS})
+
+    def delete_new_image(self, recipe, previous_image=None):
+        """
+        Удаление картинки, которую ImageField записал в хранилище
+        перед неудавшимся сохранением рецепта.
+        """
+        if recipe.image and recipe.image.name != previous_image:
+            recipe.image.delete(save=False)
+
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
 
-        recipe = Recipe.objects.filter(**validated_data).first()
-
-        if recipe:
-            return recipe
-
-        with transaction.atomic():
-            recipe, created = Recipe.objects.get_or_create(
-                author=author, **validated_data)
-
-            if created:
+        recipe = Recipe(author=author, **validated_data)
+        try:
+            with transaction.atomic():
+                recipe.save(force_insert=True)
                 recipe.tags.set(tags)
-
-                for ingredient in ingredients:
-                    IngredientInRecipes.objects.create(
-                        recipe=recipe,
-                        ingredient=get_object_or_404(
-                            Ingredient, pk=ingredient['id']),
-                        amount=ingredient['amount']
-                    )
+                self.create_ingredients(recipe, ingredients)
+        except IntegrityError:
+            self.delete_new_image(recipe)
+            self.check_name_exists(author, validated_data['name'])
+            raise
 
         return recipe
 
     def update(self, instance, validated_data):
-        with transaction.atomic():
-            tags = validated_data.pop('tags', None)
-            instance.tags.set(tags)
-            ingredients = validated_data.pop('ingredients', None)
-
-            for ingredient in ingredients:
-                ingredient_instance = get_object_or_404(
-                    Ingredient, pk=ingredient['id'])
-                IngredientInRecipes.objects.update_or_create(
-                    recipe=instance,
-                    ingredient=ingredient_instance,
-                    defaults={'amount': ingredient['amount']}
-                )
-
-            instance = super().update(instance, validated_data)
-            instance.save()
+        previous_image = instance.image.name
+        try:
+            with transaction.atomic():
+                tags = validated_data.pop('tags', None)
+                instance.tags.set(tags)
+                ingredients = validated_data.pop('ingredients', None)
+                if ingredients is not None:
+                    self.update_ingredients(instance, ingredients)
+
+                # Сохранение рецепта один раз меняет и его updated_at,
+                # по которому сбрасываются закэшированные фрагменты.
+                instance = super().update(instance, validated_data)
+        except IntegrityError:
+            self.delete_new_image(instance, previous_image)
+            self.check_name_exists(
+                instance.author_id, validated_data.get('name', instance.name),
+                exclude_pk=instance.pk)
+            raise
 
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
         serializer = RecipeSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipe.objects.listing().get(pk=instance.pk),
+            context={'request': request}
         )
 
         return serializer.data
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'thumbnails', 'search_vector')
         unique_together = ('author', 'name')
 
 
-class SmallRecipeSerializer(serializers.ModelSerializer):
+class SmallRecipeSerializer(RecipeImageSerializer,
+                            serializers.ModelSerializer):
     """Сериализатор для краткого отображения рецептов."""
 
+    def fast_representation(self, obj):
+        """Вывод рецепта без полей DRF для списков."""
+        return {
+            'id': obj.id,
+            'name': obj.name,
+            'image': self.get_image_url(obj),
+            'image_thumb': self.get_image_thumb(obj),
+            'image_srcset': self.get_image_srcset(obj),
+            'cooking_time': obj.cooking_time,
+        }
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumb', 'image_srcset',
+                  'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """
+    Список рецептов для массового добавления и удаления.
+    Существование всех рецептов проверяется одним запросом.
+    """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        ids = list(dict.fromkeys(value))
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'thumbnails', 'cooking_time'
+        ).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in recipes]
+        if missing:
+            raise ValidationError(
+                f'Несуществующие рецепты: {", ".join(map(str, missing))}.')
+        return [recipes[pk] for pk in ids]
@@ -0,0 +1,45 @@
+import csv
+import json
+
+SHOPPING_CART_TITLE = 'Список покупок с сайта FoodgramOrsha:\n\n'
+
+
+class Echo:
+    """Псевдо-буфер, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(ingredients):
+    """Построчная выгрузка списка покупок в текстовом формате."""
+    yield SHOPPING_CART_TITLE
+    for item in ingredients:
+        yield (f'{item["name"]}, {item["amount"]} '
+               f'{item["measurement_unit"]}\n')
+
+
+def shopping_cart_csv(ingredients):
+    """Построчная выгрузка списка покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in ingredients:
+        yield writer.writerow(
+            (item['name'], item['amount'], item['measurement_unit']))
+
+
+def shopping_cart_json(ingredients):
+    """Построчная выгрузка списка покупок в формате JSON."""
+    yield '['
+    separator = ''
+    for item in ingredients:
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': shopping_cart_txt,
+    'csv': shopping_cart_csv,
+    'json': shopping_cart_json,
+}
@@ -1,13 +1,55 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+from base64 import b64encode
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from PIL import Image
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITransactionTestCase
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 APITransactionTestCase)
 
-from recipes.models import Ingredient, IngredientInRecipes, Recipe
+from api.fields import StreamingBase64ImageField
+from api.pagination import CachedCountPaginator
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import (RecipeCoverageSerializer,
+                             RecipeCreateUpdateSerializer, RecipeSerializer,
+                             SubscriptionSerializer)
+from recipes.cache import (count_cache_access, get_cache_stats,
+                           get_tag_ids_by_slug)
+from recipes.images import create_thumbnails
+from recipes.models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
+                            ShoppingList, Tag)
+from recipes.search import recipe_ingredient_index
+from users.models import Subscription
 
 User = get_user_model()
 
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+         'AAAADElEQVR4nGNgYGAAAAAEAAH2FzhVAAAAAElFTkSuQmCC')
+
 
 class RecipesApiTestCase(APITransactionTestCase):
     """Тесты api рецептов.Нужно сделать больше тестов"""
@@ -41,3 +83,1371 @@ class RecipesApiTestCase(APITransactionTestCase):
         resp = self.client.get(self.url)
 
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+
+class RecipesListQueriesTestCase(APITransactionTestCase):
+    """Тесты количества запросов к БД при выводе списка рецептов."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        tags = [
+            Tag.objects.create(name=f'Tag {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ingredient {i}',
+                                      measurement_unit='g')
+            for i in range(3)
+        ]
+        for i in range(12):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com')
+            Subscription.objects.create(user=self.user, author=author)
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Recipe {i}',
+                text='Text',
+                cooking_time=10
+            )
+            recipe.tags.set(tags)
+            for ingredient in ingredients:
+                IngredientInRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=5)
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+
+    def get_page_queries(self, limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(self.url, {'limit': limit})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.data['results']), limit)
+        return len(context.captured_queries), resp.data['results']
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        small_page_queries, _ = self.get_page_queries(1)
+        large_page_queries, results = self.get_page_queries(12)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+        for recipe in results:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertTrue(recipe['author']['is_subscribed'])
+            self.assertEqual(len(recipe['tags']), 2)
+            self.assertEqual(len(recipe['ingredients']), 3)
+
+
+class ShoppingCartDownloadTestCase(APITransactionTestCase):
+    """Тесты скачивания списка покупок."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-download-shopping-cart')
+        self.user = User.objects.create_user(username='buyer')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        flour = Ingredient.objects.create(name='Мука', measurement_unit='г')
+        for i in range(10):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'Recipe {i}', text='Text',
+                cooking_time=10)
+            IngredientInRecipes.objects.create(
+                recipe=recipe, ingredient=salt, amount=2)
+            IngredientInRecipes.objects.create(
+                recipe=recipe, ingredient=flour, amount=100)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+
+    def download(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(self.url, params)
+            content = b''.join(resp.streaming_content).decode()
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # Авторизация по токену и один запрос для списка покупок.
+        self.assertEqual(len(context.captured_queries), 2)
+        return content
+
+    def test_download_txt(self):
+        content = self.download()
+
+        self.assertEqual(
+            content,
+            'Список покупок с сайта FoodgramOrsha:\n\n'
+            'Мука, 1000 г\n'
+            'Соль, 20 г\n'
+        )
+
+    def test_download_csv(self):
+        content = self.download(format='csv')
+
+        self.assertEqual(content.splitlines()[1:],
+                         ['Мука,1000,г', 'Соль,20,г'])
+
+    def test_download_json(self):
+        content = self.download(format='json')
+
+        self.assertEqual(json.loads(content), [
+            {'name': 'Мука', 'measurement_unit': 'г', 'amount': 1000},
+            {'name': 'Соль', 'measurement_unit': 'г', 'amount': 20},
+        ])
+
+
+class SubscriptionsQueriesTestCase(APITransactionTestCase):
+    """Тесты количества запросов к БД при выводе подписок."""
+
+    def setUp(self) -> None:
+        self.url = reverse('users-subscriptions')
+        self.user = User.objects.create_user(
+            username='follower', email='follower@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def subscribe(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com')
+            Subscription.objects.create(user=self.user, author=author)
+            for j in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'Recipe {j}', text='Text',
+                    cooking_time=10)
+
+    def get_subscriptions_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(
+                self.url, {'limit': 50, 'recipes_limit': 2})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), resp.data['results']
+
+    def test_subscriptions_queries_do_not_depend_on_page_size(self):
+        self.subscribe(1)
+        one_subscription_queries, _ = self.get_subscriptions_queries()
+        Subscription.objects.all().delete()
+        User.objects.exclude(pk=self.user.pk).delete()
+        self.subscribe(50)
+        many_subscriptions_queries, results = (
+            self.get_subscriptions_queries())
+
+        self.assertEqual(one_subscription_queries,
+                         many_subscriptions_queries)
+        self.assertEqual(len(results), 50)
+        for author in results:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], 3)
+            self.assertEqual(len(author['recipes']), 2)
+
+
+class ReferenceCacheTestCase(APITransactionTestCase):
+    """Тесты кэширования тегов и ингредиентов."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.url = reverse('tags-list')
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_not_modified(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_payload(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url)
+        self.assertEqual(len(resp.data), 1)
+
+    def test_invalidation_on_save(self):
+        etag = self.client.get(self.url)['ETag']
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(len(resp.data), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RECIPE_IMAGE_WORKERS=0)
+class RecipeWriteTestCase(APITransactionTestCase):
+    """Тесты создания и обновления рецептов."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ingredient {i}',
+                                      measurement_unit='g')
+            for i in range(30)
+        ]
+
+    def get_payload(self, name, ingredients):
+        return {
+            'name': name,
+            'text': 'Text',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+        }
+
+    def create_recipe_queries(self, name, ingredients):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.post(
+                self.url, self.get_payload(name, ingredients))
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        return len(context.captured_queries)
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        one_ingredient_queries = self.create_recipe_queries(
+            'Soup', [(self.ingredients[0], 1)])
+        many_ingredients_queries = self.create_recipe_queries(
+            'Stew', [(ingredient, 1) for ingredient in self.ingredients])
+
+        self.assertEqual(one_ingredient_queries, many_ingredients_queries)
+        self.assertEqual(
+            Recipe.objects.get(name='Stew').ingredient_amounts.count(), 30)
+
+    def update_recipe_queries(self, recipe, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.patch(
+                reverse('recipes-detail', args=(recipe.id,)),
+                self.get_payload(recipe.name, ingredients))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        self.create_recipe_queries(
+            'Soup', [(ingredient, 1) for ingredient in self.ingredients])
+        self.create_recipe_queries(
+            'Stew', [(ingredient, 1) for ingredient in self.ingredients[:2]])
+
+        cache.clear()
+        many_removed_queries = self.update_recipe_queries(
+            Recipe.objects.get(name='Soup'), [(self.ingredients[0], 1)])
+        cache.clear()
+        one_removed_queries = self.update_recipe_queries(
+            Recipe.objects.get(name='Stew'), [(self.ingredients[0], 1)])
+
+        self.assertEqual(many_removed_queries, one_removed_queries)
+
+    def test_image_thumbnails(self):
+        resp = self.client.post(
+            self.url, self.get_payload('Soup', [(self.ingredients[0], 1)]))
+
+        self.assertTrue(resp.data['image_thumb'].startswith(
+            'http://testserver/media/app/'))
+        resp = self.client.get(
+            reverse('recipes-detail', args=(resp.data['id'],)))
+        self.assertIn('/media/app/thumbs/', resp.data['image_thumb'])
+        self.assertIn(' 1w', resp.data['image_srcset'])
+
+    def test_update_ingredients(self):
+        self.create_recipe_queries(
+            'Soup', [(ingredient, 1) for ingredient in self.ingredients[:3]])
+        recipe = Recipe.objects.get(name='Soup')
+        first, second, third, fourth = self.ingredients[:4]
+
+        resp = self.client.patch(
+            reverse('recipes-detail', args=(recipe.id,)),
+            self.get_payload('Soup 2', [(second, 1), (third, 5),
+                                        (fourth, 7)]))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(recipe.ingredient_amounts.values_list(
+                'ingredient_id', 'amount')),
+            {second.id: 1, third.id: 5, fourth.id: 7})
+
+    def test_favorite_during_update(self):
+        self.create_recipe_queries('Soup', [(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(name='Soup')
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        update_ingredients = RecipeCreateUpdateSerializer.update_ingredients
+
+        def favorite_and_update(serializer, instance, ingredients):
+            Favorite.objects.create(user=reader, recipe=instance)
+            update_ingredients(serializer, instance, ingredients)
+
+        with mock.patch.object(RecipeCreateUpdateSerializer,
+                               'update_ingredients', favorite_and_update):
+            resp = self.client.patch(
+                reverse('recipes-detail', args=(recipe.id,)),
+                self.get_payload('Soup 2', [(self.ingredients[1], 2)]))
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['favorites_count'], 1)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.name, recipe.favorites_count),
+                         ('Soup 2', 1))
+
+    def stored_files(self):
+        return {
+            os.path.join(path, name)
+            for path, _, names in os.walk(settings.MEDIA_ROOT)
+            for name in names
+        }
+
+    def test_duplicate_name(self):
+        self.create_recipe_queries('Soup', [(self.ingredients[0], 1)])
+        self.create_recipe_queries('Stew', [(self.ingredients[0], 1)])
+        files = self.stored_files()
+
+        resp = self.client.post(
+            self.url, self.get_payload('Soup', [(self.ingredients[1], 1)]))
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', resp.data)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        stew = Recipe.objects.get(name='Stew')
+        resp = self.client.patch(
+            reverse('recipes-detail', args=(stew.id,)),
+            self.get_payload('Soup', [(self.ingredients[1], 1)]))
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', resp.data)
+        self.assertEqual(self.stored_files(), files)
+
+    def test_other_integrity_errors_not_hidden(self):
+        with mock.patch.object(
+                RecipeCreateUpdateSerializer, 'create_ingredients',
+                side_effect=IntegrityError('foreign key')):
+            with self.assertRaises(IntegrityError):
+                self.client.post(self.url, self.get_payload(
+                    'Soup', [(self.ingredients[0], 1)]))
+
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_missing_ingredients(self):
+        payload = self.get_payload('Soup', [(self.ingredients[0], 1)])
+        payload['ingredients'] += [{'id': 1000, 'amount': 1},
+                                   {'id': 999, 'amount': 1}]
+
+        resp = self.client.post(self.url, payload)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.data['ingredients'],
+                         ['Ингредиенты не найдены: 999, 1000.'])
+
+
+@skipUnless(orjson, 'orjson не установлен')
+class FastJSONTestCase(SimpleTestCase):
+    """Тесты рендерера и парсера JSON на orjson."""
+
+    data = OrderedDict((
+        ('id', 1),
+        ('name', 'Борщ\u2028с\u2029мясом'),
+        ('amount', Decimal('1.50')),
+        ('coverage', 0.1),
+        ('created', datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)),
+        ('day', date(2026, 10, 18)),
+        ('uuid', uuid.UUID(int=1)),
+        ('label', gettext_lazy('Recipe')),
+        ('tags', [{'id': 1, 'slug': 'lunch'}]),
+        ('counts', {1: 2}),
+        ('missing', None),
+    ))
+
+    def test_same_output_as_json_renderer(self):
+        expected = JSONRenderer().render(self.data)
+
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        self.assertNotIn('\u2028'.encode(), expected)
+
+    def test_indent(self):
+        rendered = FastJSONRenderer().render(
+            self.data, 'application/json; indent=4')
+
+        self.assertEqual(
+            rendered,
+            JSONRenderer().render(self.data, 'application/json; indent=4'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_parse(self):
+        body = JSONRenderer().render(self.data)
+        expected = json.loads(body)
+
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), expected)
+        self.assertEqual(
+            FastJSONParser().parse(
+                BytesIO(json.dumps(expected).encode('utf-16')),
+                parser_context={'encoding': 'utf-16'}),
+            expected)
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"id": NaN}'))
+
+
+class StreamingBase64ImageFieldTestCase(SimpleTestCase):
+    """Тесты поля картинки в формате base64."""
+
+    def setUp(self) -> None:
+        self.field = StreamingBase64ImageField()
+
+    def encode(self, size, image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, image_format)
+        return (f'data:image/{image_format.lower()};base64,'
+                + b64encode(buffer.getvalue()).decode())
+
+    def test_decode(self):
+        image_file = self.field.run_validation(self.encode((40, 20), 'JPEG'))
+
+        self.assertTrue(image_file.name.endswith('.jpg'))
+        self.assertEqual(Image.open(image_file).size, (40, 20))
+
+    def test_invalid_payload(self):
+        for data in ('not an image', 'data:image/png;base64,!!!!',
+                     'data:image/png;base64,' + b64encode(b'text').decode()):
+            with self.assertRaises(ValidationError):
+                self.field.run_validation(data)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=100)
+    def test_max_size(self):
+        with self.assertRaisesMessage(ValidationError, '100 байт'):
+            self.field.run_validation(self.encode((500, 500)))
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_max_pixels(self):
+        with self.assertRaisesMessage(ValidationError, '100 пикселей'):
+            self.field.run_validation(self.encode((20, 20)))
+
+
+class CachedCountPaginationTestCase(APITransactionTestCase):
+    """Тесты кэширования количества объектов при постраничном выводе."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.url = reverse('recipes-list')
+        author = User.objects.create_user(username='cook')
+        for i in range(3):
+            Recipe.objects.create(
+                author=author, name=f'Recipe {i}', text='Text',
+                cooking_time=10)
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(self.url, params)
+        return resp.data, [query for query in context.captured_queries
+                           if 'COUNT(' in query['sql']]
+
+    def test_count_is_cached(self):
+        data, queries = self.count_queries({'limit': 1})
+        self.assertEqual((data['count'], data['count_exact']), (3, True))
+        self.assertEqual(len(queries), 1)
+
+        data, queries = self.count_queries({'limit': 2, 'page': 2})
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(queries, [])
+
+        other_author = User.objects.create_user(
+            username='other', email='other@example.com')
+        data, queries = self.count_queries({'author': other_author.id})
+        self.assertEqual(data['count'], 0)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(PAGINATION_COUNT_ESTIMATE_THRESHOLD=1000)
+    def test_estimated_count(self):
+        with mock.patch.object(CachedCountPaginator, 'estimate_count',
+                               return_value=5000):
+            data, queries = self.count_queries({})
+
+        self.assertEqual((data['count'], data['count_exact']),
+                         (5000, False))
+        self.assertEqual(queries, [])
+
+
+class RecipeCursorPaginationTestCase(APITransactionTestCase):
+    """Тесты постраничного вывода рецептов по курсору."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        author = User.objects.create_user(username='cook')
+        for i in range(7):
+            Recipe.objects.create(
+                author=author, name=f'Recipe {i}', text='Text',
+                cooking_time=10)
+        # Рецепты с одинаковой датой упорядочиваются по названию и id.
+        Recipe.objects.filter(name__in=('Recipe 5', 'Recipe 2')).update(
+            pub_date=Recipe.objects.get(name='Recipe 3').pub_date)
+        self.expected = list(Recipe.objects.values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        url = f'{self.url}?limit=3&cursor='
+        ids = []
+        pages = []
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, status.HTTP_200_OK)
+                self.assertNotIn('count', resp.data)
+                pages.append([recipe['id'] for recipe in resp.data['results']])
+                ids += pages[-1]
+                url = resp.data['next']
+        self.assertEqual(ids, self.expected)
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in context.captured_queries))
+
+        resp = self.client.get(resp.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in resp.data['results']], pages[-2])
+        self.assertIsNone(
+            self.client.get(resp.data['previous']).data['previous'])
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(self.url, {'cursor': 'broken'})
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeFilterTestCase(APITransactionTestCase):
+    """Тесты фильтрации рецептов."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.tags = [
+            Tag.objects.create(name=f'Tag {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(3)
+        ]
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Recipe {i}', text='Text',
+                   cooking_time=10)
+            for i in range(200)
+        )
+        recipes = list(Recipe.objects.order_by('id'))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in self.tags[:2]
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe=recipe)
+            for recipe in recipes[::2]
+        )
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=self.user, recipe=recipe)
+            for recipe in recipes[::4]
+        )
+        self.params = {'tags': ['tag-0', 'tag-1'], 'is_favorited': 1,
+                       'is_in_shopping_cart': 1, 'limit': 100}
+
+    def test_no_duplicates(self):
+        resp = self.client.get(self.url, self.params)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['count'], 50)
+        ids = [recipe['id'] for recipe in resp.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_unknown_tag(self):
+        resp = self.client.get(self.url, {'tags': 'unknown'})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'План запроса проверяется только в PostgreSQL')
+    def test_no_sequential_scans(self):
+        cache.clear()
+        get_tag_ids_by_slug()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, self.params)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET enable_seqscan = off')
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN ' + query['sql'])
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                self.assertNotIn('Seq Scan', plan, query['sql'])
+            cursor.execute('RESET enable_seqscan')
+
+
+class CountersTestCase(APITransactionTestCase):
+    """Тесты счетчиков избранного, списков покупок и подписок."""
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Recipe', text='Text', cooking_time=10)
+
+    def assertCounters(self, favorites, in_carts, recipes, followers):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count,
+             self.author.recipes_count, self.author.followers_count),
+            (favorites, in_carts, recipes, followers))
+
+    def test_actions_update_counters(self):
+        self.assertCounters(0, 0, 1, 0)
+        for name in ('recipes-favorite', 'recipes-shopping-cart'):
+            url = reverse(name, args=(self.recipe.id,))
+            self.client.post(url)
+            self.client.post(url)
+        subscribe_url = reverse('users-subscribe', args=(self.author.id,))
+        resp = self.client.post(subscribe_url)
+
+        self.assertEqual(resp.data['recipes_count'], 1)
+        self.assertEqual(resp.data['followers_count'], 1)
+        self.assertCounters(1, 1, 1, 1)
+
+        self.client.delete(reverse('recipes-favorite',
+                                   args=(self.recipe.id,)))
+        self.client.delete(reverse('recipes-shopping-cart',
+                                   args=(self.recipe.id,)))
+        self.client.delete(subscribe_url)
+        self.assertCounters(0, 0, 1, 0)
+
+        Recipe.objects.filter(pk=self.recipe.pk).delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Subscription.objects.create(user=self.user, author=self.author)
+
+        recipe.name = 'Renamed'
+        recipe.save()
+        author.first_name = 'Chef'
+        author.save()
+
+        self.assertCounters(1, 0, 1, 1)
+        self.assertEqual((self.recipe.name, self.author.first_name),
+                         ('Renamed', 'Chef'))
+
+    def test_recount(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=5, in_carts_count=2)
+        User.objects.update(recipes_count=0)
+
+        out = StringIO()
+        call_command('recount', stdout=out)
+
+        self.assertIn('recipe.favorites_count: исправлено записей 1',
+                      out.getvalue())
+        self.assertCounters(1, 0, 1, 0)
+
+
+class ToggleTestCase(APITransactionTestCase):
+    """Тесты добавления и удаления избранного, списка покупок и подписок."""
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Recipe', text='Text', cooking_time=10)
+        self.urls = (
+            reverse('recipes-favorite', args=(self.recipe.id,)),
+            reverse('recipes-shopping-cart', args=(self.recipe.id,)),
+            reverse('users-subscribe', args=(self.author.id,)),
+        )
+
+    def counters(self):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        return (self.recipe.favorites_count, self.recipe.in_carts_count,
+                self.author.followers_count)
+
+    def test_repeated_requests(self):
+        for url in self.urls:
+            self.assertEqual(self.client.post(url).status_code,
+                             status.HTTP_201_CREATED)
+            self.assertEqual(self.client.post(url).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.counters(), (1, 1, 1))
+
+        for url in self.urls:
+            self.assertEqual(self.client.delete(url).status_code,
+                             status.HTTP_204_NO_CONTENT)
+            self.assertEqual(self.client.delete(url).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+        for url in (reverse('recipes-favorite', args=(0,)),
+                    reverse('recipes-shopping-cart', args=(0,)),
+                    reverse('users-subscribe', args=(0,))):
+            self.assertEqual(self.client.delete(url).status_code,
+                             status.HTTP_404_NOT_FOUND)
+
+    def test_self_subscription(self):
+        url = reverse('users-subscribe', args=(self.user.id,))
+
+        resp = self.client.post(url)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Subscription.objects.exists())
+
+    def send_concurrently(self, method, url, count=8):
+        """Одновременная отправка count одинаковых запросов."""
+        barrier = threading.Barrier(count)
+        statuses = []
+
+        def send():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'Одновременные запросы проверяются только на PostgreSQL')
+    def test_concurrent_requests(self):
+        # Связи другого пользователя: счетчики не ограничиваются нулем,
+        # и лишнее уменьшение при одновременном удалении будет заметно.
+        other = User.objects.create_user(
+            username='other', email='other@example.com')
+        Favorite.objects.create(user=other, recipe=self.recipe)
+        ShoppingList.objects.create(user=other, recipe=self.recipe)
+        Subscription.objects.create(user=other, author=self.author)
+        self.assertEqual(self.counters(), (1, 1, 1))
+
+        for url in self.urls:
+            self.assertEqual(
+                self.send_concurrently('post', url),
+                [status.HTTP_201_CREATED] + [status.HTTP_400_BAD_REQUEST] * 7)
+        self.assertEqual(self.counters(), (2, 2, 2))
+
+        for url in self.urls:
+            self.assertEqual(
+                self.send_concurrently('delete', url),
+                [status.HTTP_204_NO_CONTENT]
+                + [status.HTTP_400_BAD_REQUEST] * 7)
+        self.assertEqual(self.counters(), (1, 1, 1))
+
+
+class UserRelationsCacheTestCase(APITransactionTestCase):
+    """Тесты снимка избранного, списка покупок и подписок пользователя."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Recipe', text='Text', cooking_time=10)
+        self.url = reverse('recipes-detail', args=(self.recipe.id,))
+
+    def get_flags(self):
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(self.url).data
+        relation_queries = [
+            query for query in context.captured_queries
+            if 'recipes_favorite' in query['sql']
+            or 'users_subscription' in query['sql']
+        ]
+        return (data['is_favorited'], data['is_in_shopping_cart'],
+                data['author']['is_subscribed'], len(relation_queries))
+
+    def test_snapshot_is_cached_until_changed(self):
+        self.assertEqual(self.get_flags(), (False, False, False, 2))
+        self.assertEqual(self.get_flags(), (False, False, False, 0))
+
+        self.client.post(reverse('recipes-favorite', args=(self.recipe.id,)))
+        self.assertEqual(self.get_flags(), (True, False, False, 2))
+
+        self.client.post(reverse('users-subscribe', args=(self.author.id,)))
+        self.client.post(reverse('recipes-shopping-cart-bulk'),
+                         {'recipes': [self.recipe.id]}, format='json')
+        self.assertEqual(self.get_flags(), (True, True, True, 2))
+
+        self.client.delete(reverse('recipes-shopping-cart-bulk'))
+        self.assertEqual(self.get_flags(), (True, False, True, 2))
+        self.assertEqual(self.get_flags(), (True, False, True, 0))
+
+    def test_anonymous(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.client.credentials()
+
+        self.assertEqual(self.get_flags(), (False, False, False, 0))
+
+
+class AnonymousResponseCacheTestCase(APITransactionTestCase):
+    """Тесты кэша ответов с рецептами для анонимных пользователей."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Recipe', text='Text', cooking_time=10)
+        self.recipe.tags.add(self.tag)
+        self.url = reverse('recipes-list')
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp, len(context.captured_queries)
+
+    def test_hits_and_invalidation(self):
+        resp, _ = self.get(self.url, {'limit': 6, 'tags': 'lunch'})
+        self.assertEqual(resp['X-Cache'], 'MISS')
+
+        resp, queries = self.get(self.url + '?tags=lunch&limit=6')
+        self.assertEqual(resp['X-Cache'], 'HIT')
+        self.assertEqual(queries, 0)
+        self.assertEqual(resp.data['results'][0]['name'], 'Recipe')
+
+        changes = (
+            lambda: Recipe.objects.get(pk=self.recipe.pk).save(),
+            lambda: self.recipe.tags.clear(),
+            lambda: Tag.objects.get(pk=self.tag.pk).save(),
+            lambda: User.objects.get(pk=self.author.pk).save(),
+        )
+        for change in changes:
+            change()
+            resp, _ = self.get(self.url, {'limit': 6, 'tags': 'lunch'})
+            self.assertEqual(resp['X-Cache'], 'MISS')
+
+        detail_url = reverse('recipes-detail', args=(self.recipe.id,))
+        self.assertEqual(self.get(detail_url)[0]['X-Cache'], 'MISS')
+        self.assertEqual(self.get(detail_url)[0]['X-Cache'], 'HIT')
+
+        self.assertEqual(get_cache_stats('recipes'),
+                         {'hits': 2, 'misses': 6})
+
+    def test_stats_command(self):
+        with self.assertRaises(CommandError):
+            call_command('response_cache_stats')
+
+        location = tempfile.mkdtemp()
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        with override_settings(CACHES={
+                'default': {'BACKEND': backend, 'LOCATION': location}}):
+            for hit in (True, True, False):
+                count_cache_access('recipes', hit)
+            out = StringIO()
+            call_command('response_cache_stats', '--reset', stdout=out)
+            self.assertIn('Попаданий: 2, промахов: 1', out.getvalue())
+            self.assertEqual(get_cache_stats('recipes'),
+                             {'hits': 0, 'misses': 0})
+
+    def test_authenticated_not_cached(self):
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        self.get(self.url)
+        resp, _ = self.get(self.url)
+
+        self.assertNotIn('X-Cache', resp)
+
+    def test_login_does_not_invalidate(self):
+        self.get(self.url)
+        self.author.set_password('password')
+        self.author.save()
+        self.get(self.url)
+
+        login = self.client.post(reverse('login'), {
+            'email': 'cook@example.com', 'password': 'password'})
+        resp, _ = self.get(self.url)
+
+        self.assertEqual(login.status_code, status.HTTP_200_OK)
+        self.author.refresh_from_db()
+        self.assertIsNotNone(self.author.last_login)
+
+        self.assertEqual(resp['X-Cache'], 'HIT')
+
+
+class RecipeFragmentCacheTestCase(APITransactionTestCase):
+    """Тесты кэша сериализованных рецептов в списке."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.url = reverse('recipes-list')
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.other = User.objects.create_user(
+            username='other', email='other@example.com')
+        self.tokens = {
+            user.username: Token.objects.create(user=user).key
+            for user in (self.user, self.other)
+        }
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com', first_name='Cook')
+        self.tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch')
+        self.salt = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+        self.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Recipe {i}', text='Text',
+                cooking_time=10)
+            recipe.tags.add(self.tag)
+            IngredientInRecipes.objects.create(
+                recipe=recipe, ingredient=self.salt, amount=5)
+            self.recipes.append(recipe)
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Subscription.objects.create(user=self.user, author=self.author)
+
+    def get_list(self, username):
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + self.tokens[username])
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data['results'], context.captured_queries
+
+    def test_cached_bodies_with_user_fields(self):
+        self.get_list('reader')
+        results, queries = self.get_list('reader')
+
+        for table in ('recipes_tag', 'recipes_ingredientinrecipes',
+                      'recipes_favorite', 'users_subscription'):
+            self.assertFalse([query for query in queries
+                              if table in query['sql']])
+        self.assertEqual(
+            [(recipe['is_favorited'], recipe['favorites_count'],
+              recipe['author']['is_subscribed']) for recipe in results],
+            [(False, 0, True), (False, 0, True), (True, 1, True)])
+        self.assertEqual(results[0]['ingredients'][0]['amount'], 5)
+
+        results, _ = self.get_list('other')
+        self.assertEqual(
+            [(recipe['is_favorited'], recipe['favorites_count'],
+              recipe['author']['is_subscribed']) for recipe in results],
+            [(False, 0, False), (False, 0, False), (False, 1, False)])
+
+    def test_list_matches_detail(self):
+        results, _ = self.get_list('reader')
+        results, _ = self.get_list('reader')
+
+        for recipe in results:
+            detail = self.client.get(
+                reverse('recipes-detail', args=(recipe['id'],))).data
+            self.assertEqual(recipe, detail)
+
+    def test_invalidation(self):
+        self.get_list('reader')
+        recipe = self.recipes[-1]
+
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        resp = self.client.patch(
+            reverse('recipes-detail', args=(recipe.id,)),
+            {'tags': [self.tag.id],
+             'ingredients': [{'id': self.salt.id, 'amount': 1}]},
+            format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        results, _ = self.get_list('reader')
+        self.assertEqual(results[0]['ingredients'][0]['amount'], 1)
+
+        recipe.tags.clear()
+        results, _ = self.get_list('reader')
+        self.assertEqual(results[0]['tags'], [])
+
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        results, _ = self.get_list('reader')
+        self.assertEqual(results[1]['tags'][0]['name'], 'Ужин')
+
+        self.author.first_name = 'Chef'
+        self.author.save()
+        results, _ = self.get_list('reader')
+        self.assertEqual(results[1]['author']['first_name'], 'Chef')
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_thumbnails_invalidation(self):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, 'PNG')
+        image = default_storage.save('app/soup.png',
+                                     ContentFile(buffer.getvalue()))
+        recipe = self.recipes[-1]
+        Recipe.objects.filter(pk=recipe.pk).update(image=image)
+        results, _ = self.get_list('reader')
+        self.client.credentials()
+        self.assertNotIn('/thumbs/', self.client.get(
+            self.url).data['results'][0]['image_thumb'])
+
+        create_thumbnails(recipe.pk, image)
+        results, _ = self.get_list('reader')
+        self.assertIn('/thumbs/', results[0]['image_thumb'])
+        self.client.credentials()
+        self.assertIn('/thumbs/', self.client.get(
+            self.url).data['results'][0]['image_thumb'])
+
+
+class FastRepresentationTestCase(APITransactionTestCase):
+    """Тесты совпадения быстрого вывода списков с выводом DRF."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com',
+            first_name='Иван', last_name='Повар')
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        image = 'recipes/images/soup.png'
+        Recipe.objects.create(
+            author=author, name='Суп', text='Сварить\nи подать',
+            cooking_time=30, image=image,
+            thumbnails={'source': image, 'sizes': {
+                str(width): {'name': f'recipes/thumbs/{width}.webp',
+                             'width': width}
+                for width in (960, 480)
+            }})
+        Recipe.objects.create(
+            author=author, name='Салат', text='Нарезать', cooking_time=5)
+        for i, recipe in enumerate(Recipe.objects.all()):
+            recipe.tags.set(tags[i:])
+            for ingredient in ingredients:
+                IngredientInRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10 + i)
+        Favorite.objects.create(
+            user=self.user, recipe=Recipe.objects.get(name='Суп'))
+        Subscription.objects.create(user=self.user, author=author)
+
+        request = Request(APIRequestFactory().get(
+            '/api/users/subscriptions/', {'recipes_limit': 1}))
+        request.user = self.user
+        self.context = {'request': request}
+
+    def assertSameJSON(self, serializer_class, instances):
+        fast = serializer_class(
+            instances, many=True, context=self.context).data
+        reference = [
+            serializer_class(instance, context=self.context).data
+            for instance in instances
+        ]
+        self.assertEqual(len(fast), len(instances))
+        self.assertEqual(JSONRenderer().render(fast),
+                         JSONRenderer().render(reference))
+
+    def test_recipes(self):
+        recipes = list(Recipe.objects.listing())
+        self.assertSameJSON(RecipeSerializer, recipes)
+        self.assertSameJSON(RecipeSerializer, recipes)
+
+        for recipe in recipes:
+            recipe.coverage = 0.5
+            recipe.missing_count = 2
+        self.assertSameJSON(RecipeCoverageSerializer, recipes)
+
+    def test_subscriptions(self):
+        authors = list(User.objects.filter(username='cook'))
+        self.assertSameJSON(SubscriptionSerializer, authors)
+
+
+class BulkRelationsTestCase(APITransactionTestCase):
+    """Тесты массового изменения избранного и списка покупок."""
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='planner', email='planner@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.recipes = [
+            Recipe.objects.create(author=author, name=f'Recipe {i}',
+                                  text='Text', cooking_time=10)
+            for i in range(3)
+        ]
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def counters(self, field):
+        return list(Recipe.objects.order_by('id').values_list(
+            field, flat=True))
+
+    def test_bulk_add_and_delete(self):
+        for name, model, field in (
+            ('recipes-favorite-bulk', Favorite, 'favorites_count'),
+            ('recipes-shopping-cart-bulk', ShoppingList, 'in_carts_count'),
+        ):
+            url = reverse(name)
+            model.objects.create(user=self.user, recipe=self.recipes[0])
+
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post(
+                    url, {'recipes': self.ids + self.ids[:1]}, format='json')
+            writes = [query['sql'].split()[0] for query in queries
+                      if query['sql'].startswith(('INSERT', 'UPDATE'))]
+            self.assertEqual(writes, ['INSERT', 'UPDATE'])
+
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+            self.assertEqual([recipe['id'] for recipe in resp.data],
+                             self.ids[1:])
+            self.assertEqual(self.counters(field), [1, 1, 1])
+
+            resp = self.client.delete(
+                url, {'recipes': self.ids[:2]}, format='json')
+
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual([recipe['id'] for recipe in resp.data],
+                             self.ids[:2])
+            self.assertEqual(self.counters(field), [0, 0, 1])
+
+            resp = self.client.delete(url)
+
+            self.assertEqual([recipe['id'] for recipe in resp.data],
+                             self.ids[2:])
+            self.assertFalse(model.objects.exists())
+            self.assertEqual(self.counters(field), [0, 0, 0])
+
+    def test_missing_recipes(self):
+        url = reverse('recipes-shopping-cart-bulk')
+
+        for data in ({'recipes': self.ids + [0]},
+                     {'recipes': self.ids + [self.ids[-1] + 1]},
+                     {'recipes': []}, {}):
+            resp = self.client.post(url, data, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertFalse(ShoppingList.objects.exists())
+
+
+class RecipeOrderingTestCase(APITransactionTestCase):
+    """Тесты сортировки рецептов."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.recipes = [
+            Recipe.objects.create(author=author, name=f'Recipe {i}',
+                                  text='Text', cooking_time=time)
+            for i, time in enumerate((30, 10, 20))
+        ]
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com')
+            for recipe in self.recipes[:i + 1]:
+                Favorite.objects.create(user=user, recipe=recipe)
+        call_command('refresh_scores', stdout=StringIO())
+
+    def get_ids(self, ordering):
+        resp = self.client.get(self.url, {'ordering': ordering})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in resp.data['results']]
+
+    def test_ordering(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+
+        self.assertEqual(self.get_ids('popular'), [first, second, third])
+        self.assertEqual(self.get_ids('trending'), [first, second, third])
+        self.assertEqual(self.get_ids('cooking_time'),
+                         [second, third, first])
+
+    def test_new_recipe_in_popular(self):
+        Recipe.objects.create(author=self.recipes[0].author, name='New',
+                              text='Text', cooking_time=5)
+
+        self.assertEqual(len(self.get_ids('popular')), 4)
+
+    def test_invalid_ordering(self):
+        resp = self.client.get(self.url, {'ordering': 'name'})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_with_ordering(self):
+        resp = self.client.get(self.url, {'ordering': 'popular',
+                                          'cursor': ''})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchTestCase(APITransactionTestCase):
+    """Тесты полнотекстового поиска рецептов."""
+
+    def setUp(self) -> None:
+        self.url = reverse('recipes-list')
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        beet = Ingredient.objects.create(name='Свекла', measurement_unit='г')
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        recipes = (
+            ('Печеная свекла', 'Запечь в духовке.', salt),
+            ('Борщ', 'Главное - свекла и капуста.', salt),
+            ('Винегрет', 'Смешать овощи.', beet),
+            ('Компот', 'Сварить фрукты.', salt),
+        )
+        self.recipes = []
+        for name, text, ingredient in recipes:
+            with transaction.atomic():
+                recipe = Recipe.objects.create(
+                    author=author, name=name, text=text, cooking_time=10)
+                IngredientInRecipes.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+            self.recipes.append(recipe)
+
+    def search(self, query, **params):
+        resp = self.client.get(self.url, {'search': query, **params})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in resp.data['results']]
+
+    def test_ranking(self):
+        self.assertEqual(self.search('свекла'),
+                         [recipe.id for recipe in self.recipes[:3]])
+
+    def test_cursor_with_search(self):
+        resp = self.client.get(self.url, {'search': 'свекла', 'cursor': ''})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', resp.data)
+
+    def test_all_words(self):
+        self.assertEqual(self.search('свекла капуста'),
+                         [self.recipes[1].id])
+        self.assertEqual(self.search('ананас'), [])
+
+    def test_ordering_overrides_rank(self):
+        self.assertEqual(self.search('свекла', ordering='cooking_time'),
+                         sorted(recipe.id for recipe in self.recipes[:3]))
+
+    def test_update_after_rename(self):
+        recipe = self.recipes[3]
+        recipe.name = 'Свекольник'
+        recipe.text = 'Нужна свекла.'
+        recipe.save()
+
+        self.assertIn(recipe.id, self.search('свекла'))
+
+
+class WhatToCookTestCase(APITransactionTestCase):
+    """Тесты подбора рецептов по имеющимся ингредиентам."""
+
+    def setUp(self) -> None:
+        recipe_ingredient_index.clear()
+        self.url = reverse('recipes-what-to-cook')
+        self.author = User.objects.create_user(
+            username='cook', email='cook@example.com')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ingredient {i}',
+                                      measurement_unit='g')
+            for i in range(4)
+        ]
+        self.recipes = [
+            self.create_recipe(f'Recipe {i}', self.ingredients[:size])
+            for i, size in enumerate((1, 2, 4))
+        ]
+
+    def create_recipe(self, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='Text', cooking_time=10)
+        IngredientInRecipes.objects.bulk_create(
+            IngredientInRecipes(recipe=recipe, ingredient=ingredient,
+                                amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def get_results(self, *ingredients):
+        resp = self.client.get(
+            self.url, {'ingredients': [i.id for i in ingredients]})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [(recipe['id'], recipe['coverage'], recipe['missing_count'])
+                for recipe in resp.data['results']]
+
+    def test_ranking(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+
+        self.assertEqual(
+            self.get_results(*self.ingredients[:2]),
+            [(second, 1.0, 0), (first, 1.0, 0), (third, 0.5, 2)])
+        self.assertEqual(self.get_results(self.ingredients[3]),
+                         [(third, 0.25, 3)])
+
+    def test_index_invalidation(self):
+        third = self.recipes[2].id
+        self.assertEqual(self.get_results(self.ingredients[3]),
+                         [(third, 0.25, 3)])
+
+        recipe = self.create_recipe('New', [])
+        IngredientInRecipes.objects.create(
+            recipe=recipe, ingredient=self.ingredients[3], amount=1)
+        # До конца фоновой перестройки ответ строится по прежнему снимку.
+        self.assertEqual(self.get_results(self.ingredients[3]),
+                         [(third, 0.25, 3)])
+        recipe_ingredient_index.join()
+        self.assertEqual(self.get_results(self.ingredients[3]),
+                         [(recipe.id, 1.0, 0), (third, 0.25, 3)])
+
+    def test_recipe_save_keeps_index(self):
+        self.get_results(self.ingredients[0])
+        self.recipes[0].name = 'Renamed'
+        self.recipes[0].save()
+
+        with mock.patch.object(recipe_ingredient_index,
+                               'start_rebuild') as start_rebuild:
+            self.get_results(self.ingredients[0])
+        start_rebuild.assert_not_called()
+
+    def test_constant_queries(self):
+        self.get_results(self.ingredients[0])
+        with CaptureQueriesContext(connection) as context:
+            self.get_results(self.ingredients[0])
+
+        self.assertLessEqual(len(context.captured_queries), 4)
+
+    def test_invalid_ingredients(self):
+        for params in ({}, {'ingredients': 'salt'}):
+            resp = self.client.get(self.url, params)
+            self.assertEqual(resp.status_code,
+                             status.HTTP_400_BAD_REQUEST)
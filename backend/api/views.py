@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -8,23 +11,93 @@ from rest_framework import exceptions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api.mixins import TagIngredientMixin
-from api.pagination import CustomPagination
+from api.mixins import AnonymousCacheMixin, TagIngredientMixin
+from api.pagination import (CachedCountPagination, CustomPagination,
+                            RecipePagination)
 from api.permissions import IsAuthorOrAdminPermission
+from api.renderers import CSVRenderer, PlainTextRenderer
 from api.serializers import (CustomUserSerializer, IngredientSerializer,
-                             RecipeCreateUpdateSerializer, RecipeSerializer,
-                             SmallRecipeSerializer, SubscriptionSerializer,
-                             TagSerializer)
+                             RecipeCoverageSerializer,
+                             RecipeCreateUpdateSerializer, RecipeIdsSerializer,
+                             RecipeSerializer, SmallRecipeSerializer,
+                             SubscriptionSerializer, TagSerializer)
+from api.shopping_cart import SHOPPING_CART_FORMATS
 from recipes.models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
                             ShoppingList, Tag)
+from recipes.relations import relations_changed, remove_relations
+from recipes.search import ingredient_index, recipe_ingredient_index
 from users.models import Subscription
 
 from .filters import IngredientFilter, RecipeFilter
 
 User = get_user_model()
 
+BULK_ATTEMPTS = 3
+
+
+def create_relation(model, error_message, **fields):
+    """
+    Добавление связи одним INSERT. Повторное добавление, в том числе
+    из одновременных запросов, отсекает ограничение уникальности.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.create(**fields)
+    except IntegrityError:
+        raise exceptions.ValidationError(error_message)
+
+
+def delete_relation(model, **fields):
+    """
+    Удаление связи: из одновременных запросов связь удаляет
+    (и уменьшает счетчики) только один.
+    Возвращает количество удаленных связей.
+    """
+    return len(remove_relations(model, **fields))
+
+
+def add_relations(model, user, recipes):
+    """
+    Массовое добавление рецептов в избранное или список покупок
+    одним INSERT. Уже добавленные рецепты пропускаются, счетчики
+    и снимок связей пользователя меняются без сигналов сохранения.
+    Возвращает добавленные рецепты.
+    """
+    for _ in range(BULK_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                existing = set(model.objects.filter(
+                    user=user, recipe__in=recipes
+                ).order_by().values_list('recipe_id', flat=True))
+                added = [
+                    recipe for recipe in recipes if recipe.pk not in existing
+                ]
+                model.objects.bulk_create(
+                    model(user=user, recipe=recipe) for recipe in added)
+                relations_changed(
+                    model, user.pk, [recipe.pk for recipe in added], 1)
+            return added
+        except IntegrityError:
+            # Часть рецептов добавлена одновременным запросом.
+            continue
+    raise exceptions.ValidationError(
+        'Список изменился во время запроса, повторите его.')
+
+
+def delete_relations(model, user, recipe_ids=None):
+    """
+    Массовое удаление рецептов из избранного или списка покупок
+    одним DELETE, без recipe_ids удаляются все рецепты пользователя.
+    Возвращает id удаленных рецептов.
+    """
+    filters = {'user': user}
+    if recipe_ids is not None:
+        filters['recipe_id__in'] = recipe_ids
+    return remove_relations(model, **filters)
+
 # Приложение users
 
 
@@ -33,7 +106,7 @@ class CustomUserViewSet(UserViewSet):
     Вьюсет для работы с моделью - User и Subscription.
     """
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = CustomPagination
+    pagination_class = CachedCountPagination
 
     def partial_update(self, request, *args, **kwargs):
         user_id = kwargs.get('pk')
@@ -66,13 +139,31 @@ class CustomUserViewSet(UserViewSet):
         """Метод для просмотра подписок."""
         user = self.request.user
 
-        user_subscriptions = user.follower.all()
-        authors = user_subscriptions.values_list('author_id', flat=True)
+        queryset = User.objects.filter(followed__user=user).order_by('id')
+        authors = self.paginate_queryset(queryset)
+
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is not None:
+            try:
+                recipes_limit = int(recipes_limit)
+            except ValueError:
+                raise exceptions.ValidationError(
+                    {'recipes_limit': 'Введите целое число.'})
 
-        queryset = User.objects.filter(pk__in=authors)
-        paginated_queryset = self.paginate_queryset(queryset)
+        author_recipes = defaultdict(list)
+        if authors:
+            recipes = Recipe.objects.filter(
+                author__in=authors).defer('search_vector')
+            if recipes_limit is not None:
+                recipes = recipes.limit_per_author(recipes_limit)
+            for recipe in recipes:
+                author_recipes[recipe.author_id].append(recipe)
 
-        serializer = self.get_serializer(paginated_queryset, many=True)
+        for author in authors:
+            author.is_followed = True
+            author.limited_recipes = author_recipes[author.id]
+
+        serializer = self.get_serializer(authors, many=True)
 
         return self.get_paginated_response(serializer.data)
 
@@ -85,24 +176,25 @@ class CustomUserViewSet(UserViewSet):
     def subscribe(self, request, id=None):
         """Метод для оформления подписки."""
         user = self.request.user
-        author = get_object_or_404(User, pk=id)
 
         if request.method == 'POST':
+            author = get_object_or_404(User, pk=id)
             if user == author:
                 raise exceptions.ValidationError(
                     'Подписка на самого себя запрещена.'
                 )
-            if Subscription.objects.filter(user=user, author=author).exists():
-                raise exceptions.ValidationError('Вы уже подписаны.')
-
-            Subscription.objects.create(user=user, author=author)
+            create_relation(Subscription, 'Вы уже подписаны.',
+                            user=user, author=author)
+            author.refresh_from_db(fields=('followers_count',))
             serializer = self.get_serializer(author)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = get_object_or_404(
-            Subscription, user=user, author=author)
-        subscription.delete()
+        if not delete_relation(Subscription, user=user, author_id=id):
+            get_object_or_404(User, pk=id)
+            return Response(
+                {'detail': 'Вы не подписаны на этого пользователя.'},
+                status=status.HTTP_400_BAD_REQUEST)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -115,6 +207,7 @@ class TagViewSet(TagIngredientMixin):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    reference_name = 'tags'
 
 
 class IngredientViewSet(TagIngredientMixin):
@@ -125,19 +218,56 @@ class IngredientViewSet(TagIngredientMixin):
     pagination_class = None
     filter_backends = (IngredientFilter, )
     search_fields = ('^name', )
+    reference_name = 'ingredients'
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по названию обслуживается индексом в памяти:
+        сначала совпадения по началу названия, затем по подстроке.
+        """
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise exceptions.ValidationError(
+                    {'limit': 'Введите целое число.'})
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """Вьюсет для работы с рецептами."""
+        return self.cached_response(
+            request,
+            lambda: Response(ingredient_index.search(name, limit))
+        )
+
+
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    """
+    Вьюсет для работы с рецептами.
+    Список и карточки рецептов для анонимных пользователей кэшируются.
+    """
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminPermission,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
+    cache_version_name = 'recipes'
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return Recipe.objects.defer('search_vector')
+        if self.action == 'retrieve':
+            return Recipe.objects.listing()
+
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateUpdateSerializer
+        if self.action == 'what_to_cook':
+            return RecipeCoverageSerializer
 
         return RecipeSerializer
 
@@ -154,19 +284,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 return Response({'detail': 'Несуществующий рецепт'},
                                 status=status.HTTP_400_BAD_REQUEST)
 
-            favorite, created = Favorite.objects.get_or_create(
-                user=user, recipe=recipe)
-            if not created:
-                raise exceptions.ValidationError(
-                    'Рецепт уже добавлен в избранное.')
-
+            create_relation(Favorite, 'Рецепт уже добавлен в избранное.',
+                            user=user, recipe=recipe)
             serializer = SmallRecipeSerializer(
                 recipe, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        recipe = get_object_or_404(Recipe, pk=pk)
-        favorite = get_object_or_404(Favorite, user=user, recipe=recipe)
-        favorite.delete()
+        if not delete_relation(Favorite, user=user, recipe_id=pk):
+            get_object_or_404(Recipe, pk=pk)
+            return Response({'detail': 'Рецепта нет в избранном.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=('post', 'delete'))
@@ -177,57 +305,126 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == 'DELETE':
-            recipe = get_object_or_404(Recipe, pk=pk)
-            shopping_list = ShoppingList.objects.filter(
-                user=user, recipe=recipe)
-
-            if shopping_list.exists():
-                shopping_list.delete()
+            if delete_relation(ShoppingList, user=user, recipe_id=pk):
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
+            get_object_or_404(Recipe, pk=pk)
             return Response({'detail': 'Рецепта нет в списке покупок.'},
                             status=status.HTTP_400_BAD_REQUEST)
 
         recipe = get_object_or_404(Recipe, pk=pk)
-        if ShoppingList.objects.filter(user=user, recipe=recipe).exists():
-            raise exceptions.ValidationError('Рецепт уже в списке покупок.')
-
-        ShoppingList.objects.create(user=user, recipe=recipe)
+        create_relation(ShoppingList, 'Рецепт уже в списке покупок.',
+                        user=user, recipe=recipe)
         serializer = SmallRecipeSerializer(
             recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def bulk_relations(self, request, model):
+        """
+        Массовое добавление и удаление рецептов списком id в поле recipes.
+        DELETE без recipes очищает список пользователя.
+        """
+        context = {'request': request}
+        if request.method == 'DELETE' and 'recipes' not in request.data:
+            recipes = Recipe.objects.filter(
+                pk__in=delete_relations(model, request.user)
+            ).defer('search_vector').order_by('id')
+            return Response(SmallRecipeSerializer(
+                recipes, many=True, context=context).data)
+
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+
+        if request.method == 'POST':
+            added = add_relations(model, request.user, recipes)
+            return Response(
+                SmallRecipeSerializer(added, many=True, context=context).data,
+                status=status.HTTP_201_CREATED)
+
+        deleted = set(delete_relations(
+            model, request.user, [recipe.pk for recipe in recipes]))
+        return Response(SmallRecipeSerializer(
+            [recipe for recipe in recipes if recipe.pk in deleted],
+            many=True, context=context).data)
+
+    @action(detail=False, methods=('post', 'delete'),
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        """Метод для массового добавления и удаления избранного."""
+        return self.bulk_relations(request, Favorite)
+
+    @action(detail=False, methods=('post', 'delete'),
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        """Метод для массового изменения списка покупок."""
+        return self.bulk_relations(request, ShoppingList)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        pagination_class=CustomPagination
+    )
+    def what_to_cook(self, request):
+        """
+        Метод для подбора рецептов по имеющимся ингредиентам.
+        Ингредиенты задаются параметрами ingredients, первыми идут
+        рецепты с большей долей имеющихся ингредиентов.
+        """
+        try:
+            ingredient_ids = [
+                int(pk) for pk in request.query_params.getlist('ingredients')
+            ]
+        except ValueError:
+            raise exceptions.ValidationError(
+                {'ingredients': 'Введите целые числа.'})
+        if not ingredient_ids:
+            raise exceptions.ValidationError(
+                {'ingredients': 'Укажите хотя бы один ингредиент.'})
+
+        page = self.paginate_queryset(
+            recipe_ingredient_index.search(ingredient_ids))
+        recipes = Recipe.objects.defer('search_vector').in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+
+        found = []
+        for recipe_id, matched, total in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage = matched / total
+                recipe.missing_count = total - matched
+                found.append(recipe)
+
+        serializer = self.get_serializer(found, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer)
     )
     def download_shopping_cart(self, request):
         """
         Метод для скачивания списка покупок.
+        Формат выгрузки задается параметром format: txt, csv или json.
         """
-        shopping_cart = ShoppingList.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        buy_list = IngredientInRecipes.objects.filter(
-            recipe__in=recipes
+        file_format = request.accepted_renderer.format
+        ingredients = IngredientInRecipes.objects.filter(
+            recipe__shopping_lists__user=request.user
         ).values(
-            'ingredient'
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
         ).annotate(
             amount=Sum('amount')
-        )
+        ).order_by('name', 'measurement_unit')
 
-        buy_list_text = 'Список покупок с сайта FoodgramOrsha:\n\n'
-        for item in buy_list:
-            ingredient = Ingredient.objects.get(pk=item['ingredient'])
-            amount = item['amount']
-            buy_list_text += (
-                f'{ingredient.name}, {amount} '
-                f'{ingredient.measurement_unit}\n'
-            )
-
-        response = HttpResponse(buy_list_text, content_type="text/plain")
+        response = StreamingHttpResponse(
+            SHOPPING_CART_FORMATS[file_format](ingredients),
+            content_type=request.accepted_renderer.media_type
+        )
         response['Content-Disposition'] = (
-            'attachment; filename=список покупок.txt'
+            f'attachment; filename=список покупок.{file_format}'
         )
 
         return response
@@ -79,6 +79,42 @@ DATABASES = {
     }
 }
 
+# Кэш в памяти процесса по умолчанию не виден другим процессам,
+# в том числе командам manage.py (например, response_cache_stats),
+# для них нужен общий CACHE_BACKEND: memcached или файловый кэш.
+# В кэше хранятся фрагменты рецептов, ответы для анонимных
+# пользователей, снимки связей пользователей и версии данных,
+# поэтому для кэша в памяти или в файлах размер (по умолчанию у Django
+# всего 300 записей) задается CACHE_MAX_ENTRIES.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'FileBasedCache')):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20_000)),
+    }
+
+# Время хранения кэша тегов и ингредиентов, в секундах.
+REFERENCE_CACHE_TIMEOUT = 300
+
+# Время хранения ответов со списком и карточками рецептов
+# для анонимных пользователей, в секундах. Ответы сбрасываются
+# при изменении рецептов, а счетчики избранного и списков покупок
+# в них могут отставать не дольше этого времени.
+ANONYMOUS_RESPONSE_CACHE_TIMEOUT = 60
+
+# Время хранения сериализованных рецептов без отметок пользователя
+# и счетчиков, в секундах.
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Время хранения снимка избранного, списка покупок и подписок
+# пользователя, в секундах.
+USER_RELATIONS_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -125,11 +161,53 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+# Ширина уменьшенных копий картинок рецептов: для списка и для страницы
+# рецепта, и количество потоков для их создания (0 - сразу при сохранении).
+RECIPE_THUMBNAIL_WIDTHS = (480, 960)
+RECIPE_IMAGE_WORKERS = 2
+
+# Ограничения для картинок рецептов: размер файла в байтах
+# и количество пикселей.
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 25_000_000
+
+# Время хранения количества объектов для постраничного вывода, в секундах,
+# и количество строк, начиная с которого в PostgreSQL вместо COUNT(*)
+# используется оценка планировщика.
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 100_000
+
+# Время жизни индексов ингредиентов и ингредиентов рецептов
+# в памяти процесса, в секундах.
+INGREDIENT_INDEX_TTL = 300
+RECIPE_INGREDIENT_INDEX_TTL = 300
+
+# Перестраивать устаревший индекс ингредиентов рецептов в фоновом потоке,
+# отвечая до конца перестройки по прежнему снимку.
+RECIPE_INGREDIENT_INDEX_BACKGROUND = True
+
+# Веса добавления рецепта в избранное и в список покупок для популярности
+# рецептов, период полураспада и окно расчета популярности
+# за последнее время, в часах.
+RECIPE_SCORE_FAVORITE_WEIGHT = 2
+RECIPE_SCORE_CART_WEIGHT = 1
+RECIPE_TRENDING_HALF_LIFE = 24
+RECIPE_TRENDING_WINDOW = 7 * 24
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
 }
 
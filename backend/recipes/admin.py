@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 
 from .models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
                      ShoppingList, Tag)
@@ -27,21 +26,13 @@ class IngredientInRecipesInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientInRecipesInline]
-    list_display = ('name', 'author_name', 'count_favorited')
+    list_display = ('name', 'author_name', 'favorites_count',
+                    'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('author', 'tags')
+    list_select_related = ('author',)
     search_fields = ('name',)
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        queryset = queryset.annotate(
-            _count_favorited=Count('favorite_recipes'))
-        return queryset
-
-    def count_favorited(self, obj):
-        return obj._count_favorited
-    count_favorited.admin_order_field = '_count_favorited'
-    count_favorited.short_description = 'В избранном'
-
     def author_name(self, obj):
         return obj.author.get_full_name() or obj.author.username
     author_name.short_description = 'Автор'
@@ -56,6 +47,21 @@ class IngredientInRecipesAdmin(admin.ModelAdmin):
     search_fields = ('recipe__name', 'ingredient__name')
     fields = ('recipe', 'ingredient', 'amount')
 
+    # Ингредиенты рецепта меняются без сохранения рецепта,
+    # поэтому дата его изменения обновляется здесь.
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk=obj.recipe_id).touch()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).touch()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -0,0 +1,103 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingList, Tag
+from users.models import Subscription
+
+VERSION_KEY = 'foodgram:{}:version'
+STATS_KEY = 'foodgram:{}:stats:{}'
+
+UserRelations = namedtuple(
+    'UserRelations', ('favorites', 'shopping_cart', 'following'))
+
+
+def get_version(name):
+    """
+    Текущая версия справочных данных - время их последнего изменения
+    в наносекундах. Хранится в кэше без срока действия, чтобы данные
+    с более долгим сроком не пережили свою версию, и создается
+    при первом обращении.
+    """
+    version = cache.get(VERSION_KEY.format(name))
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_KEY.format(name), version, None)
+        version = cache.get(VERSION_KEY.format(name), version)
+    return version
+
+
+def bump_version(name):
+    """Сменить версию, сделав недействительными закэшированные данные."""
+    cache.set(VERSION_KEY.format(name), time.time_ns(), None)
+
+
+def bump_version_on_commit(name):
+    """Сменить версию после фиксации транзакции с изменениями."""
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def count_cache_access(name, hit):
+    """Учет попаданий и промахов кэша name."""
+    key = STATS_KEY.format(name, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_cache_stats(name):
+    """Количество попаданий и промахов кэша name."""
+    keys = {kind: STATS_KEY.format(name, kind) for kind in ('hits', 'misses')}
+    values = cache.get_many(keys.values())
+    return {kind: values.get(key, 0) for kind, key in keys.items()}
+
+
+def reset_cache_stats(name):
+    """Обнуление статистики кэша name."""
+    cache.delete_many(
+        [STATS_KEY.format(name, kind) for kind in ('hits', 'misses')])
+
+
+def get_tag_ids_by_slug():
+    """Словарь slug -> id тегов, хранится до смены версии тегов."""
+    key = f'foodgram:tags:{get_version("tags")}:ids'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, settings.REFERENCE_CACHE_TIMEOUT)
+    return tag_ids
+
+
+def get_user_relations(user_id):
+    """
+    Снимок связей пользователя: id рецептов в избранном и в списке
+    покупок и id авторов, на которых он подписан.
+    Хранится до смены версии связей пользователя.
+    """
+    version = get_version(f'relations:{user_id}')
+    key = f'foodgram:relations:{user_id}:{version}'
+    relations = cache.get(key)
+    if relations is None:
+        relations = UserRelations(
+            frozenset(Favorite.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True)),
+            frozenset(ShoppingList.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True)),
+            frozenset(Subscription.objects.filter(
+                user_id=user_id).values_list('author_id', flat=True)),
+        )
+        cache.set(key, relations, settings.USER_RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def invalidate_user_relations(user_id):
+    """
+    Сменить версию связей пользователя после фиксации транзакции,
+    чтобы снимок не был закэширован заново до появления изменений.
+    """
+    bump_version_on_commit(f'relations:{user_id}')
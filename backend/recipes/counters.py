@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Subscription
+
+User = get_user_model()
+
+# Счетчик: (модель, поле счетчика, считаемая модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарное изменение счетчика на delta одним UPDATE.
+    Значение не опускается ниже нуля даже при расхождении с реальным.
+    """
+    return model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def change_counters(model, pks, field, delta):
+    """Изменение счетчика сразу у нескольких записей одним UPDATE."""
+    return model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def actual_count(related_model, related_field):
+    """Подзапрос с реальным количеством связанных записей."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def recount():
+    """
+    Пересчет всех счетчиков. Обновляются только записи,
+    у которых сохраненное значение расходится с реальным.
+    Возвращает количество исправленных записей по каждому счетчику.
+    """
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        count = actual_count(related_model, related_field)
+        drifted = list(
+            model.objects.annotate(
+                actual=count
+            ).exclude(**{field: F('actual')}).values_list('pk', flat=True)
+        )
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(**{field: count})
+        fixed[f'{model._meta.model_name}.{field}'] = len(drifted)
+    return fixed
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError, features
+
+from recipes.cache import bump_version_on_commit
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXTENSION = THUMBNAIL_FORMAT.lower()
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    return _executor
+
+
+def schedule_thumbnails(recipe_id, image_name):
+    """
+    Поставить создание уменьшенных копий картинки в очередь пула.
+    При RECIPE_IMAGE_WORKERS = 0 копии создаются сразу.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        create_thumbnails(recipe_id, image_name)
+        return
+    get_executor().submit(run_in_worker, recipe_id, image_name)
+
+
+def run_in_worker(recipe_id, image_name):
+    try:
+        create_thumbnails(recipe_id, image_name)
+    except Exception:
+        logger.exception('Не удалось создать копии картинки %s',
+                         image_name)
+    finally:
+        connection.close()
+
+
+def save_thumbnail(image, width):
+    """Сохранить копию шириной не более width под хэшем содержимого."""
+    thumbnail = image.copy()
+    thumbnail.thumbnail((width, width * 10))
+    if THUMBNAIL_FORMAT == 'JPEG' and thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    buffer = BytesIO()
+    thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=80)
+    content = buffer.getvalue()
+
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    name = f'app/thumbs/{digest}.{THUMBNAIL_EXTENSION}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name, thumbnail.width
+
+
+def create_thumbnails(recipe_id, image_name):
+    """
+    Создать уменьшенные копии картинки рецепта
+    для размеров из RECIPE_THUMBNAIL_WIDTHS.
+    """
+    try:
+        with default_storage.open(image_name) as image_file:
+            image = Image.open(image_file)
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Не удалось открыть картинку %s', image_name)
+        return
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    sizes = {}
+    for width in settings.RECIPE_THUMBNAIL_WIDTHS:
+        name, actual_width = save_thumbnail(image, width)
+        sizes[str(width)] = {'name': name, 'width': actual_width}
+
+    # updated_at меняется вместе с копиями: по нему строятся ключи
+    # закэшированных фрагментов рецептов в списках.
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        thumbnails={'source': image_name, 'sizes': sizes},
+        updated_at=timezone.now())
+    if updated:
+        bump_version_on_commit('recipes')
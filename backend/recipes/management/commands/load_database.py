@@ -1,25 +1,115 @@
+import csv
 import json
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.cache import bump_version
 from recipes.models import Ingredient, Tag
+from recipes.search import ingredient_index
 
 
 class Command(BaseCommand):
     help = 'Загрузить данные в модель ингредиентов и тэгов'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default='data/ingredients.json',
+            help='Файл с ингредиентами в формате JSON или CSV')
+        parser.add_argument(
+            '--format', choices=('json', 'csv'),
+            help='Формат файла, по умолчанию определяется по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество ингредиентов, добавляемых одним запросом')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Подсчитать новые ингредиенты без записи в базу')
+
+    def read_ingredients(self, path, file_format):
+        """
+        Построчное чтение пар (название, единица измерения).
+        Пустые строки CSV пропускаются, строки меньше чем
+        из двух полей пропускаются с предупреждением.
+        """
+        with open(path, encoding='utf-8', newline='') as data_file:
+            if file_format == 'csv':
+                reader = csv.reader(data_file)
+                for row in reader:
+                    if not any(field.strip() for field in row):
+                        continue
+                    if len(row) < 2:
+                        self.stderr.write(self.style.WARNING(
+                            f'Строка {reader.line_num} пропущена: нужны '
+                            'название и единица измерения'))
+                        continue
+                    yield row[0], row[1]
+            else:
+                for ingredient in json.load(data_file):
+                    yield ingredient['name'], ingredient['measurement_unit']
+
+    def load_ingredients(self, path, file_format, batch_size, dry_run):
+        """
+        Добавить ингредиенты, которых еще нет в базе.
+        Возвращает количество прочитанных и добавленных записей.
+        """
+        seen = set(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        count_before = len(seen)
+        total = 0
+        batch = []
+        for name, measurement_unit in self.read_ingredients(
+                path, file_format):
+            total += 1
+            if (name, measurement_unit) in seen:
+                continue
+            seen.add((name, measurement_unit))
+            batch.append(
+                Ingredient(name=name, measurement_unit=measurement_unit))
+            if len(batch) >= batch_size:
+                if not dry_run:
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                batch = []
+        if batch and not dry_run:
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+
+        if dry_run:
+            return total, len(seen) - count_before
+        return total, Ingredient.objects.count() - count_before
+
     def handle(self, *args, **options):
+        path = Path(options['file'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        dry_run = options['dry_run']
+
         self.stdout.write(self.style.WARNING('Загрузка данных в базу начата'))
-        with open('data/ingredients.json', encoding='utf-8',
-                  ) as data_file_ingredients:
-            ingredient_data = json.loads(data_file_ingredients.read())
-            for ingredients in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredients)
-
-        with open('data/tags.json', encoding='utf-8',
-                  ) as data_file_tags:
-            tags_data = json.loads(data_file_tags.read())
-            for tags in tags_data:
-                Tag.objects.get_or_create(**tags)
+        with transaction.atomic():
+            total, inserted = self.load_ingredients(
+                path, file_format, options['batch_size'], dry_run)
+
+            with open('data/tags.json', encoding='utf-8',
+                      ) as data_file_tags:
+                tags_data = json.load(data_file_tags)
+            if not dry_run:
+                Tag.objects.bulk_create(
+                    (Tag(**tag) for tag in tags_data), ignore_conflicts=True)
+
+        self.stdout.write(
+            f'Ингредиентов в файле: {total}, '
+            f'добавлено: {inserted}, пропущено: {total - inserted}')
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                'Пробный запуск, база не изменена'))
+            return
 
+        ingredient_index.invalidate()
+        bump_version('ingredients')
+        bump_version('tags')
         self.stdout.write(self.style.SUCCESS('Данные загружены'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать счетчики избранного, списков покупок, '
+            'рецептов и подписчиков')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = recount()
+        for counter, count in fixed.items():
+            self.stdout.write(f'{counter}: исправлено записей {count}')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
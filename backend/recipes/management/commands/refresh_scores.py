@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.scores import refresh_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать популярность рецептов для сортировки '
+            'ordering=popular и ordering=trending. '
+            'Запускается периодически, например раз в 10 минут')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            refreshed = refresh_scores()
+        self.stdout.write(
+            'Создано строк: {created}, обновлено популярность: {popular}, '
+            'за последнее время: {trending}'.format(**refreshed))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать поисковые векторы всех рецептов, например '
+            'после массовой загрузки рецептов в обход моделей')
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors(Recipe.objects.all())
+        self.stdout.write(f'Обновлено рецептов: {updated}')
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id);',
+            reverse_sql='DROP INDEX recipes_recipe_tags_tag_recipe_idx;',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+INGREDIENT_NAME_PREFIX_INDEX = 'recipes_ingredient_name_upper_prefix_idx'
+
+
+def create_ingredient_name_prefix_index(apps, schema_editor):
+    """
+    Индекс для поиска по началу названия без учета регистра
+    (name__istartswith -> UPPER(name) LIKE 'X%'), только PostgreSQL.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX {INGREDIENT_NAME_PREFIX_INDEX} '
+            'ON recipes_ingredient (UPPER(name) text_pattern_ops);')
+
+
+def drop_ingredient_name_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {INGREDIENT_NAME_PREFIX_INDEX};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'name', 'id'], name='recipe_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', 'name'], name='recipe_author_listing_idx'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата создания рецепта'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipes',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), include=('amount',), name='unique_ingredient_in_recipe'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingredientinrecipes',
+            unique_together=set(),
+        ),
+        migrations.RunPython(
+            create_ingredient_name_prefix_index,
+            drop_ingredient_name_prefix_index,
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:05
+
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+SEARCH_VECTOR_INDEX = 'recipe_search_vector_idx'
+
+
+def create_search_vectors(apps, schema_editor):
+    """
+    Заполнение поисковых векторов и GIN-индекс по ним, только PostgreSQL.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientInRecipes = apps.get_model('recipes', 'IngredientInRecipes')
+    ingredient_names = Subquery(
+        IngredientInRecipes.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+    )
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('text', weight='B', config='russian')
+        + SearchVector(ingredient_names, weight='C', config='russian')
+    ))
+    schema_editor.execute(
+        f'CREATE INDEX {SEARCH_VECTOR_INDEX} '
+        'ON recipes_recipe USING gin (search_vector);')
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_vectors, drop_search_vector_index),
+    ]
@@ -1,10 +1,15 @@
 from typing import Optional
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from users.models import CounterFieldsMixin
 
 User = get_user_model()
 
@@ -81,8 +86,51 @@ class RecipeQuerySet(models.QuerySet):
             ),
         )
 
+    def listing(self):
+        """
+        Рецепты со всеми данными для отображения списка
+        за постоянное число запросов. Отметки избранного, списка покупок
+        и подписки берутся из снимка связей пользователя.
+        """
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_amounts',
+                queryset=IngredientInRecipes.objects.select_related(
+                    'ingredient')
+            ),
+        )
+
+    def touch(self):
+        """
+        Смена даты изменения рецептов, по которой сбрасываются
+        их закэшированные фрагменты, одним UPDATE.
+        """
+        return self.update(updated_at=timezone.now())
+
+    def limit_per_author(self, limit: int):
+        """
+        Не более limit первых рецептов каждого автора одним запросом.
+        """
+        queryset = self.annotate(
+            author_position=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('name').asc()),
+            )
+        )
+        sql, params = queryset.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            'WHERE ranked.author_position <= %s '
+            'ORDER BY ranked.author_id, ranked.author_position',
+            (*params, limit)
+        )
+
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """
     Модель для рецептов.
     """
@@ -109,6 +157,11 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='app/')
+    thumbnails = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False)
     text = models.TextField(
         'Описание'
     )
@@ -121,14 +174,38 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(
         'Дата создания рецепта',
-        auto_now_add=True,
-        db_index=True)
+        auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения рецепта',
+        auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False)
+
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', 'name',)
         unique_together = ('author', 'name')
+        indexes = (
+            models.Index(fields=('-pub_date', 'name', 'id'),
+                         name='recipe_listing_idx'),
+            models.Index(fields=('author', '-pub_date', 'name'),
+                         name='recipe_author_listing_idx'),
+            models.Index(fields=('cooking_time', 'id'),
+                         name='recipe_cooking_time_idx'),
+        )
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -164,7 +241,13 @@ class IngredientInRecipes(models.Model):
 
     class Meta:
         ordering = ('ingredient', )
-        unique_together = ('recipe', 'ingredient')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                include=('amount',),
+                name='unique_ingredient_in_recipe'
+            ),
+        )
         verbose_name = 'ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
 
@@ -187,6 +270,10 @@ class Favorite(models.Model):
         verbose_name='рецепты',
         on_delete=models.CASCADE,
         related_name='favorite_recipes')
+    added = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True)
 
     class Meta:
         ordering = ('user', )
@@ -220,6 +307,10 @@ class ShoppingList(models.Model):
         related_name='shopping_lists',
         verbose_name='Рецепт в корзине'
     )
+    added = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True)
 
     class Meta:
         verbose_name = 'список покупок'
@@ -233,3 +324,38 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class RecipeScore(models.Model):
+    """
+    Модель для предрасчитанной популярности рецептов.
+    Пересчитывается командой refresh_scores.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='score',
+        verbose_name='Рецепт')
+    popular = models.PositiveIntegerField(
+        'Популярность',
+        default=0)
+    trending = models.FloatField(
+        'Популярность за последнее время',
+        default=0)
+    updated_at = models.DateTimeField(
+        'Дата пересчета',
+        auto_now=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('-popular', '-recipe'),
+                         name='recipe_score_popular_idx'),
+            models.Index(fields=('-trending', '-recipe'),
+                         name='recipe_score_trending_idx'),
+        )
+        verbose_name = 'популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular} / {self.trending:.2f}'
@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from recipes.cache import invalidate_user_relations
+from recipes.counters import change_counters
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Subscription
+
+User = get_user_model()
+
+# Связь пользователя: (модель, счетчик, поле связи со считаемой моделью).
+RELATIONS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe'),
+    ShoppingList: (Recipe, 'in_carts_count', 'recipe'),
+    Subscription: (User, 'followers_count', 'author'),
+}
+
+
+def relations_changed(model, user_id, target_ids, delta):
+    """
+    Последствия добавления (delta=1) или удаления (delta=-1) связей
+    пользователя с target_ids: счетчики и снимок связей пользователя.
+    Вызывается и сигналами, и массовыми операциями без сигналов,
+    поэтому новые последствия изменения связей добавляются сюда.
+    """
+    if not target_ids:
+        return
+    counted_model, field, _ = RELATIONS[model]
+    change_counters(counted_model, target_ids, field, delta)
+    invalidate_user_relations(user_id)
+
+
+def remove_relations(model, **filters):
+    """
+    Удаление связей без сигналов удаления: строки блокируются,
+    затем удаляются по первичным ключам через DELETE ... RETURNING.
+    Связи, удаленные одновременным запросом, не возвращаются, поэтому
+    последствия применяются только к действительно удаленным связям.
+    Возвращает id объектов удаленных связей.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+    user_column = meta.get_field('user').column
+    target_column = meta.get_field(RELATIONS[model][2]).column
+
+    with transaction.atomic():
+        pks = list(model.objects.select_for_update().filter(
+            **filters).order_by().values_list('pk', flat=True))
+        if not pks:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(meta.db_table)} '
+                f'WHERE {quote(meta.pk.column)} IN '
+                f'({", ".join(["%s"] * len(pks))}) '
+                f'RETURNING {quote(user_column)}, {quote(target_column)}',
+                pks
+            )
+            deleted = cursor.fetchall()
+        by_user = defaultdict(list)
+        for user_id, target_id in deleted:
+            by_user[user_id].append(target_id)
+        for user_id, target_ids in by_user.items():
+            relations_changed(model, user_id, target_ids, -1)
+    return [target_id for _, target_id in deleted]
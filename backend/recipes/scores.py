@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.cache import bump_version_on_commit
+from recipes.models import Favorite, Recipe, RecipeScore, ShoppingList
+
+BATCH_SIZE = 1000
+
+
+def create_missing_scores():
+    """Строки популярности для рецептов, у которых их еще нет."""
+    missing = Recipe.objects.filter(
+        score__isnull=True).values_list('pk', flat=True)
+    created = RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=pk) for pk in missing.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    return len(created)
+
+
+def refresh_popular(now):
+    """
+    Популярность за все время по счетчикам избранного и списков покупок.
+    Обновляются только строки, у которых значение изменилось.
+    """
+    changed = RecipeScore.objects.annotate(
+        new_popular=(
+            F('recipe__favorites_count')
+            * settings.RECIPE_SCORE_FAVORITE_WEIGHT
+            + F('recipe__in_carts_count')
+            * settings.RECIPE_SCORE_CART_WEIGHT
+        )
+    ).exclude(popular=F('new_popular')).values_list('pk', 'new_popular')
+    scores = [
+        RecipeScore(recipe_id=pk, popular=popular, updated_at=now)
+        for pk, popular in changed.iterator()
+    ]
+    RecipeScore.objects.bulk_update(
+        scores, ('popular', 'updated_at'), batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def refresh_trending(now):
+    """
+    Популярность за последнее время: сумма весов добавлений в избранное
+    и в списки покупок за окно RECIPE_TRENDING_WINDOW, вес добавления
+    уменьшается вдвое каждые RECIPE_TRENDING_HALF_LIFE часов.
+    Пересчитываются только рецепты с добавлениями в окне и рецепты,
+    у которых популярность за последнее время еще не обнулена.
+    """
+    window_start = now - timedelta(hours=settings.RECIPE_TRENDING_WINDOW)
+    half_life = timedelta(
+        hours=settings.RECIPE_TRENDING_HALF_LIFE).total_seconds()
+    trending = defaultdict(float)
+    for model, weight in (
+        (Favorite, settings.RECIPE_SCORE_FAVORITE_WEIGHT),
+        (ShoppingList, settings.RECIPE_SCORE_CART_WEIGHT),
+    ):
+        additions = model.objects.filter(
+            added__gte=window_start
+        ).values_list('recipe_id', 'added')
+        for recipe_id, added in additions.iterator():
+            age = max((now - added).total_seconds(), 0)
+            trending[recipe_id] += weight * 0.5 ** (age / half_life)
+
+    outdated = RecipeScore.objects.filter(
+        trending__gt=0).values_list('pk', flat=True)
+    recipe_ids = trending.keys() | set(outdated)
+    scores = [
+        RecipeScore(recipe_id=pk, trending=trending.get(pk, 0),
+                    updated_at=now)
+        for pk in recipe_ids
+    ]
+    RecipeScore.objects.bulk_update(
+        scores, ('trending', 'updated_at'), batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def refresh_scores(now=None):
+    """
+    Пересчет популярности рецептов. При изменениях сбрасываются
+    закэшированные ответы с рецептами, отсортированными по популярности.
+    Возвращает количество созданных и обновленных строк.
+    """
+    now = now or timezone.now()
+    refreshed = {
+        'created': create_missing_scores(),
+        'popular': refresh_popular(now),
+        'trending': refresh_trending(now),
+    }
+    if refreshed['popular'] or refreshed['trending']:
+        bump_version_on_commit('recipes')
+    return refreshed
@@ -0,0 +1,380 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, connections
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery, Value,
+                              When)
+
+from recipes.models import Ingredient, IngredientInRecipes
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = 'russian'
+
+# Веса совпадений в названии, описании и ингредиентах рецепта,
+# как у ts_rank по умолчанию для весов A, B и C.
+SEARCH_WEIGHTS = (1.0, 0.4, 0.2)
+
+
+class InMemoryIndex(ABC):
+    """
+    Индекс в памяти процесса.
+    Строится из БД при первом обращении и перестраивается
+    после сброса или по истечении времени жизни. При background=True
+    устаревший индекс перестраивается в фоновом потоке, а до конца
+    перестройки поиск идет по прежнему снимку.
+    Последний элемент снимка индекса - время его построения.
+    """
+
+    def __init__(self, ttl=None, background=False):
+        self.ttl = ttl
+        self.background = background
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (поколение, снимок): поколение - число сбросов до построения.
+        self._state = None
+        self._rebuild_thread = None
+
+    def invalidate(self):
+        """Сбросить индекс, он будет перестроен при следующем поиске."""
+        self._generation += 1
+
+    def clear(self):
+        """Удалить снимок, следующий поиск построит индекс сразу."""
+        self._state = None
+
+    @abstractmethod
+    def build(self):
+        """Построить снимок индекса из БД."""
+
+    def build_state(self):
+        generation = self._generation
+        return generation, self.build()
+
+    def get_snapshot(self):
+        state = self._state
+        if state is not None and self.is_stale(state) and self.background:
+            self.start_rebuild()
+        elif state is None or self.is_stale(state):
+            with self._lock:
+                state = self._state
+                if state is None or self.is_stale(state):
+                    state = self._state = self.build_state()
+        return state[1]
+
+    def is_stale(self, state):
+        generation, snapshot = state
+        return generation != self._generation or (
+            self.ttl is not None
+            and time.monotonic() - snapshot[-1] > self.ttl)
+
+    def start_rebuild(self):
+        """Запустить перестройку в фоне, если она еще не идет."""
+        with self._lock:
+            if self._rebuild_thread and self._rebuild_thread.is_alive():
+                return
+            self._rebuild_thread = threading.Thread(
+                target=self.rebuild_in_background, daemon=True,
+                name=f'{type(self).__name__}-rebuild')
+            self._rebuild_thread.start()
+
+    def rebuild_in_background(self):
+        try:
+            self._state = self.build_state()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс %s',
+                             type(self).__name__)
+        finally:
+            connection.close()
+
+    def join(self, timeout=None):
+        """Дождаться окончания фоновой перестройки индекса."""
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class IngredientIndex(InMemoryIndex):
+    """Индекс названий ингредиентов."""
+
+    def build(self):
+        """Загрузить ингредиенты из БД и отсортировать по названию."""
+        entries = sorted(
+            (name.lower(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit')
+        )
+        keys = [entry[0] for entry in entries]
+        return keys, entries, time.monotonic()
+
+    def search(self, query, limit=None):
+        """
+        Ингредиенты, название которых начинается с query,
+        а за ними - содержащие query в середине названия.
+        """
+        query = query.strip().lower()
+        keys, entries, _ = self.get_snapshot()
+        found = []
+
+        position = bisect_left(keys, query)
+        while (position < len(keys) and keys[position].startswith(query)
+               and (limit is None or len(found) < limit)):
+            found.append(entries[position])
+            position += 1
+
+        if query and (limit is None or len(found) < limit):
+            for entry in entries:
+                if query in entry[0] and not entry[0].startswith(query):
+                    found.append(entry)
+                    if limit is not None and len(found) == limit:
+                        break
+
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientIndex(
+    ttl=getattr(settings, 'INGREDIENT_INDEX_TTL', 300))
+
+
+def to_bitmap(positions, size):
+    """Битовая карта: число, в котором установлены биты positions."""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bit_count(bitmap):
+    return bin(bitmap).count('1')
+
+
+class IngredientCoverage:
+    """
+    Рецепты, подобранные по ингредиентам, в порядке убывания доли
+    имеющихся ингредиентов, а при равной доле - от новых к старым.
+    Элементы - (id рецепта, есть ингредиентов, всего ингредиентов).
+    Последовательность ленивая: номера рецептов извлекаются из битовых
+    карт только для запрошенного среза, поэтому подходит для Paginator.
+    """
+
+    def __init__(self, recipe_ids, buckets, length):
+        self.recipe_ids = recipe_ids
+        self.buckets = buckets
+        self.length = length
+        self._sizes = {}
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.length)
+        found = []
+        offset = 0
+        for number, (matched, total, bitmap) in enumerate(self.buckets):
+            if offset >= stop:
+                break
+            if number not in self._sizes:
+                self._sizes[number] = bit_count(bitmap)
+            size = self._sizes[number]
+            if offset + size > start:
+                skip = max(start - offset, 0)
+                take = min(stop - offset, size) - skip
+                found.extend(
+                    (self.recipe_ids[position], matched, total)
+                    for position in self.positions(bitmap, skip, take)
+                )
+            offset += size
+        return found
+
+    @staticmethod
+    def positions(bitmap, skip, take):
+        """Номера установленных битов от старшего к младшему."""
+        bits = bin(bitmap)[2:]
+        index = -1
+        for _ in range(skip):
+            index = bits.find('1', index + 1)
+        for _ in range(take):
+            index = bits.find('1', index + 1)
+            yield len(bits) - 1 - index
+
+
+class RecipeIngredientIndex(InMemoryIndex):
+    """
+    Обратный индекс ингредиентов рецептов. Рецепты пронумерованы
+    по возрастанию id, для каждого ингредиента хранится битовая карта
+    рецептов, в которые он входит (для редких ингредиентов - массив
+    номеров), и битовые карты рецептов с одинаковым числом ингредиентов.
+    """
+
+    def build(self):
+        recipe_ids = array('q')
+        postings = defaultdict(partial(array, 'l'))
+        sizes = array('l')
+        rows = IngredientInRecipes.objects.order_by(
+            'recipe_id').values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10_000):
+            if not recipe_ids or recipe_ids[-1] != recipe_id:
+                recipe_ids.append(recipe_id)
+                sizes.append(0)
+            postings[ingredient_id].append(len(recipe_ids) - 1)
+            sizes[-1] += 1
+
+        count = len(recipe_ids)
+        postings = {
+            ingredient_id: (
+                to_bitmap(positions, count)
+                if len(positions) * 64 >= count else positions
+            )
+            for ingredient_id, positions in postings.items()
+        }
+        positions_by_size = defaultdict(list)
+        for position, size in enumerate(sizes):
+            positions_by_size[size].append(position)
+        size_bitmaps = {
+            size: to_bitmap(positions, count)
+            for size, positions in positions_by_size.items()
+        }
+        return recipe_ids, postings, size_bitmaps, time.monotonic()
+
+    def search(self, ingredient_ids):
+        """
+        Рецепты, в которые входит хотя бы один из ингредиентов.
+        Количество имеющихся ингредиентов каждого рецепта считается
+        побитовым сложением карт ингредиентов.
+        """
+        recipe_ids, postings, size_bitmaps, _ = self.get_snapshot()
+        count = len(recipe_ids)
+        matched_any = 0
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            posting = postings.get(ingredient_id)
+            if posting is None:
+                continue
+            carry = (posting if isinstance(posting, int)
+                     else to_bitmap(posting, count))
+            matched_any |= carry
+            for plane, value in enumerate(planes):
+                planes[plane], carry = value ^ carry, value & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+
+        everything = (1 << count) - 1
+        buckets = []
+        for matched in range(1, 1 << len(planes)):
+            exactly = everything
+            for plane, value in enumerate(planes):
+                exactly &= value if matched >> plane & 1 else ~value
+            if not exactly:
+                continue
+            for total, size_bitmap in size_bitmaps.items():
+                bitmap = exactly & size_bitmap
+                if bitmap:
+                    buckets.append((matched, total, bitmap))
+        buckets.sort(key=lambda bucket: (-bucket[0] / bucket[1], -bucket[0]))
+        return IngredientCoverage(recipe_ids, buckets, bit_count(matched_any))
+
+
+recipe_ingredient_index = RecipeIngredientIndex(
+    ttl=getattr(settings, 'RECIPE_INGREDIENT_INDEX_TTL', 300),
+    background=getattr(settings, 'RECIPE_INGREDIENT_INDEX_BACKGROUND', True))
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    """
+    Поисковый вектор рецепта: название (вес A), описание (вес B)
+    и названия ингредиентов (вес C).
+    """
+    ingredient_names = Subquery(
+        IngredientInRecipes.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Пересчет поисковых векторов рецептов, только в PostgreSQL."""
+    if not is_postgresql(queryset):
+        return 0
+    return queryset.update(search_vector=recipe_search_vector())
+
+
+def rank_in_memory(queryset, query):
+    """
+    Ранжирование рецептов перебором в памяти для СУБД без полнотекстового
+    поиска: рецепт подходит, если каждое слово запроса есть в названии,
+    описании или ингредиентах. Морфология не учитывается.
+    """
+    words = query.lower().split()
+    ingredient_names = defaultdict(list)
+    for recipe_id, name in IngredientInRecipes.objects.filter(
+        recipe__in=queryset.values('pk')
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredient_names[recipe_id].append(name.lower())
+
+    ranks = {}
+    for pk, name, text in queryset.order_by().values_list(
+            'pk', 'name', 'text'):
+        fields = (name.lower(), text.lower(),
+                  ' '.join(ingredient_names[pk]))
+        word_ranks = [
+            max((weight for field, weight in zip(fields, SEARCH_WEIGHTS)
+                 if word in field), default=0)
+            for word in words
+        ]
+        if word_ranks and all(word_ranks):
+            ranks[pk] = sum(word_ranks)
+    return ranks
+
+
+def search_recipes(queryset, query):
+    """
+    Полнотекстовый поиск рецептов, более релевантные - первыми.
+    В PostgreSQL используется поисковый вектор с GIN-индексом,
+    в остальных СУБД - ранжирование в памяти.
+    """
+    if is_postgresql(queryset):
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query))
+    else:
+        ranks = rank_in_memory(queryset, query)
+        if not ranks:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=ranks).annotate(
+            search_rank=Case(
+                *(When(pk=pk, then=Value(rank))
+                  for pk, rank in ranks.items()),
+                output_field=FloatField()
+            )
+        )
+    return queryset.order_by('-search_rank', '-pub_date', 'name', 'id')
@@ -0,0 +1,156 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.cache import bump_version_on_commit
+from recipes.counters import change_counter
+from recipes.images import schedule_thumbnails
+from recipes.models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
+                            RecipeScore, ShoppingList, Tag)
+from recipes.relations import RELATIONS, relations_changed
+from recipes.search import (ingredient_index, recipe_ingredient_index,
+                            update_search_vectors)
+from users.models import Subscription
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    """
+    Сброс индекса и кэша ингредиентов после фиксации транзакции,
+    чтобы одновременный запрос не закэшировал прежние данные
+    под новой версией.
+    """
+    transaction.on_commit(ingredient_index.invalidate)
+    bump_version_on_commit('ingredients')
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search(sender, instance, created, raw=False,
+                                     **kwargs):
+    """Обновление поиска по рецептам с переименованным ингредиентом."""
+    if not created and not raw:
+        update_search_vectors(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipes)
+def invalidate_recipe_ingredients(sender, **kwargs):
+    """
+    Сброс обратного индекса ингредиентов рецептов после фиксации
+    транзакции: ингредиенты рецепта сохраняются вместе с ним.
+    При удалении рецепта сигнал приходит для каждого его ингредиента.
+    """
+    transaction.on_commit(recipe_ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    """Сброс кэша тегов после фиксации транзакции с их изменением."""
+    bump_version_on_commit('tags')
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_thumbnails(sender, instance, **kwargs):
+    """Создание уменьшенных копий новой картинки рецепта."""
+    image_name = instance.image.name
+    if image_name and instance.thumbnails.get('source') != image_name:
+        transaction.on_commit(
+            lambda: schedule_thumbnails(instance.pk, image_name))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, raw=False, **kwargs):
+    """
+    Обновление поискового вектора после фиксации транзакции,
+    когда ингредиенты рецепта уже сохранены.
+    """
+    if not raw:
+        transaction.on_commit(lambda: update_search_vectors(
+            Recipe.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(sender, instance, created, raw=False, **kwargs):
+    """Строка популярности для нового рецепта."""
+    if created and not raw:
+        RecipeScore.objects.create(recipe=instance)
+
+
+def update_counter(model, field, pk_attr, created, signal, instance):
+    """Изменение счетчика при создании или удалении записи."""
+    if signal is post_save and not created:
+        return
+    delta = 1 if signal is post_save else -1
+    change_counter(model, getattr(instance, pk_attr), field, delta)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def count_recipes(sender, instance, signal, created=False, **kwargs):
+    """Счетчик рецептов автора."""
+    update_counter(User, 'recipes_count', 'author_id',
+                   created, signal, instance)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Subscription)
+def change_relation(sender, instance, signal, created=False, **kwargs):
+    """
+    Счетчики и снимок связей пользователя при добавлении и удалении
+    одной связи: избранного, списка покупок или подписки.
+    """
+    if signal is post_save and not created:
+        return
+    target_id = getattr(instance, RELATIONS[sender][2] + '_id')
+    relations_changed(sender, instance.user_id, [target_id],
+                      1 if signal is post_save else -1)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientInRecipes)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_responses(sender, **kwargs):
+    """Сброс закэшированных ответов с рецептами при изменении их данных."""
+    bump_version_on_commit('recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, instance, update_fields=None,
+                                **kwargs):
+    """
+    Сброс закэшированных ответов с рецептами при изменении профиля
+    автора. Обновление времени входа и пользователи без рецептов
+    на ответы не влияют.
+    """
+    if (update_fields != {'last_login'}
+            and Recipe.objects.filter(author=instance).exists()):
+        bump_version_on_commit('recipes')
+        bump_version_on_commit('recipe-fragments')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_recipe_fragments(sender, **kwargs):
+    """
+    Сброс всех закэшированных рецептов при изменении тегов
+    и ингредиентов, которые выводятся в рецептах.
+    """
+    bump_version_on_commit('recipe-fragments')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, **kwargs):
+    """
+    Смена даты изменения рецепта при изменении его тегов.
+    При изменении рецептов со стороны тега сбрасываются все рецепты.
+    """
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        bump_version_on_commit('recipe-fragments')
+    else:
+        Recipe.objects.filter(pk=instance.pk).touch()
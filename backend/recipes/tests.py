@@ -1,7 +1,24 @@
+import os
+import random
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from recipes.cache import get_version
+from recipes.images import THUMBNAIL_FORMAT, create_thumbnails
 
-from recipes.models import Favorite, Ingredient, IngredientInRecipes, Recipe
+from recipes.models import (Favorite, Ingredient, IngredientInRecipes, Recipe,
+                            RecipeScore, ShoppingList, Tag)
+from recipes.scores import refresh_scores
+from recipes.search import ingredient_index, recipe_ingredient_index
 
 User = get_user_model()
 
@@ -33,3 +50,224 @@ class RecipeModelTestCase(TestCase):
         qs = Recipe.objects.add_user_annotations(user_id=self.user.id)
         is_favorite = qs.values()[0]['is_favorite']
         self.assertTrue(is_favorite)
+
+
+class IngredientIndexTestCase(TestCase):
+
+    def setUp(self) -> None:
+        for name in ('соль морская', 'морская капуста', 'морковь', 'Мука'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        ingredient_index.clear()
+
+    def test_prefix_before_substring(self):
+        """Тест порядка: сначала префикс, затем подстрока."""
+        names = [item['name'] for item in ingredient_index.search('мор')]
+        self.assertEqual(names,
+                         ['морковь', 'морская капуста', 'соль морская'])
+
+    def test_limit(self):
+        """Тест ограничения количества результатов."""
+        self.assertEqual(len(ingredient_index.search('м', limit=2)), 2)
+
+    def test_invalidation(self):
+        """Тест сброса индекса при изменении ингредиентов."""
+        self.assertEqual(ingredient_index.search('сахар'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            sugar = Ingredient.objects.create(
+                name='сахар', measurement_unit='г')
+            # До фиксации транзакции индекс не сбрасывается.
+            self.assertEqual(ingredient_index.search('сах'), [])
+
+        self.assertEqual(ingredient_index.search('сах'), [
+            {'id': sugar.id, 'name': 'сахар', 'measurement_unit': 'г'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            sugar.delete()
+        self.assertEqual(ingredient_index.search('сах'), [])
+
+
+class ReferenceCacheTestCase(TestCase):
+
+    def test_tags_version_changes_on_commit(self):
+        """Тест смены версии кэша тегов только после фиксации."""
+        version = get_version('tags')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#000000', slug='dinner')
+            self.assertEqual(get_version('tags'), version)
+
+        self.assertNotEqual(get_version('tags'), version)
+
+
+class RecipeIngredientIndexTestCase(TestCase):
+
+    def setUp(self) -> None:
+        recipe_ingredient_index.clear()
+        author = User.objects.create_user(username='vi')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient {i}', measurement_unit='г')
+            for i in range(12)
+        )
+        ingredients = list(Ingredient.objects.order_by('id'))
+        choice = random.Random(0)
+        self.recipe_ingredients = {}
+        for i in range(80):
+            recipe = Recipe.objects.create(
+                author=author, name=f'recipe {i}', cooking_time=5)
+            chosen = choice.sample(ingredients, choice.randint(1, 6))
+            IngredientInRecipes.objects.bulk_create(
+                IngredientInRecipes(recipe=recipe, ingredient=ingredient,
+                                    amount=1)
+                for ingredient in chosen
+            )
+            self.recipe_ingredients[recipe.id] = {
+                ingredient.id for ingredient in chosen}
+        self.ingredient_ids = [ingredient.id for ingredient in ingredients]
+        recipe_ingredient_index.clear()
+
+    def expected(self, ingredient_ids):
+        found = []
+        for recipe_id, recipe_ingredients in self.recipe_ingredients.items():
+            matched = len(recipe_ingredients & set(ingredient_ids))
+            if matched:
+                found.append((recipe_id, matched, len(recipe_ingredients)))
+        return sorted(found, key=lambda item: (
+            -item[1] / item[2], -item[1], -item[0]))
+
+    def test_matches_full_scan(self):
+        """Тест совпадения выдачи индекса с полным перебором."""
+        choice = random.Random(1)
+        for size in (1, 2, 3, 5, 8, 12):
+            ingredient_ids = choice.sample(self.ingredient_ids, size)
+            expected = self.expected(ingredient_ids)
+            found = recipe_ingredient_index.search(ingredient_ids)
+
+            self.assertEqual(len(found), len(expected))
+            self.assertEqual(found[:len(found)], expected)
+            self.assertEqual(found[5:17], expected[5:17])
+
+    def test_unknown_ingredient(self):
+        """Тест поиска по ингредиенту, которого нет в рецептах."""
+        self.assertEqual(len(recipe_ingredient_index.search([0])), 0)
+
+
+class LoadDatabaseTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.data_file = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8', delete=False)
+        self.addCleanup(os.remove, self.data_file.name)
+        self.data_file.write('соль,г\nсахар,г\nсоль,г\nсоль,кг\n')
+        self.data_file.close()
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('load_database', '--file', self.data_file.name,
+                     *args, stdout=out)
+        return out.getvalue()
+
+    def test_load_csv(self):
+        """Тест загрузки только новых ингредиентов."""
+        out = self.load('--batch-size', '1')
+
+        self.assertIn('добавлено: 2, пропущено: 2', out)
+        self.assertEqual(Ingredient.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertIn('добавлено: 0, пропущено: 4', self.load())
+
+    def test_short_and_blank_rows(self):
+        """Тест пропуска пустых и неполных строк CSV."""
+        with open(self.data_file.name, 'a', encoding='utf-8') as data_file:
+            data_file.write('\nперец\n  \nмука,г\n\n')
+        err = StringIO()
+        call_command('load_database', '--file', self.data_file.name,
+                     stdout=StringIO(), stderr=err)
+
+        self.assertIn('Строка 6 пропущена', err.getvalue())
+        self.assertEqual(err.getvalue().count('пропущена'), 1)
+        self.assertTrue(Ingredient.objects.filter(name='мука').exists())
+
+    def test_dry_run(self):
+        """Тест пробного запуска без записи в базу."""
+        out = self.load('--dry-run')
+
+        self.assertIn('добавлено: 2, пропущено: 2', out)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertFalse(Tag.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(),
+                   RECIPE_THUMBNAIL_WIDTHS=(480, 960))
+class RecipeThumbnailsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        user = User.objects.create_user(username='vi')
+        self.recipe = Recipe.objects.create(author=user, cooking_time=30)
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600)).save(buffer, 'PNG')
+        self.recipe.image.save('big.png', ContentFile(buffer.getvalue()))
+
+    def test_create_thumbnails(self):
+        """Тест создания уменьшенных копий картинки."""
+        create_thumbnails(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        thumbnails = self.recipe.thumbnails
+        self.assertEqual(thumbnails['source'], self.recipe.image.name)
+        for width, size in thumbnails['sizes'].items():
+            self.assertEqual(size['width'], int(width))
+            with default_storage.open(size['name']) as thumbnail_file:
+                thumbnail = Image.open(thumbnail_file)
+                self.assertEqual(thumbnail.format, THUMBNAIL_FORMAT)
+                self.assertEqual(thumbnail.size,
+                                 (int(width), int(width) // 2))
+
+
+@override_settings(RECIPE_SCORE_FAVORITE_WEIGHT=2, RECIPE_SCORE_CART_WEIGHT=1,
+                   RECIPE_TRENDING_HALF_LIFE=24, RECIPE_TRENDING_WINDOW=48)
+class RecipeScoresTestCase(TestCase):
+
+    def setUp(self) -> None:
+        author = User.objects.create_user(username='cook')
+        self.users = [
+            User.objects.create_user(username=f'user{i}',
+                                     email=f'user{i}@example.com')
+            for i in range(3)
+        ]
+        self.old, self.new = (
+            Recipe.objects.create(author=author, name=name, cooking_time=5)
+            for name in ('old', 'new')
+        )
+
+    def add(self, model, recipe, user, hours_ago):
+        addition = model.objects.create(user=user, recipe=recipe)
+        model.objects.filter(pk=addition.pk).update(
+            added=timezone.now() - timedelta(hours=hours_ago))
+
+    def test_refresh(self):
+        for user in self.users:
+            self.add(Favorite, self.old, user, hours_ago=72)
+        self.add(Favorite, self.new, self.users[0], hours_ago=0)
+        self.add(ShoppingList, self.new, self.users[1], hours_ago=24)
+
+        refresh_scores()
+
+        old, new = (RecipeScore.objects.get(recipe=recipe)
+                    for recipe in (self.old, self.new))
+        self.assertEqual((old.popular, new.popular), (6, 3))
+        self.assertEqual(old.trending, 0)
+        self.assertAlmostEqual(new.trending, 2.5, places=3)
+
+    def test_incremental_refresh(self):
+        RecipeScore.objects.filter(recipe=self.old).delete()
+        self.add(Favorite, self.new, self.users[0], hours_ago=1)
+
+        self.assertEqual(refresh_scores(),
+                         {'created': 1, 'popular': 1, 'trending': 1})
+
+        Favorite.objects.all().delete()
+        refreshed = refresh_scores()
+
+        self.assertEqual(refreshed,
+                         {'created': 0, 'popular': 1, 'trending': 1})
+        self.assertEqual(RecipeScore.objects.get(recipe=self.new).trending,
+                         0)
@@ -6,9 +6,11 @@ from .models import Subscription, User
 @admin.register(User)
 class PostAdmin(admin.ModelAdmin):
     list_display = (
-        'pk', 'email', 'username', 'first_name', 'last_name', 'is_subscribed'
+        'pk', 'email', 'username', 'first_name', 'last_name', 'is_subscribed',
+        'recipes_count', 'followers_count'
     )
     list_display_links = ('email', 'username')
+    readonly_fields = ('recipes_count', 'followers_count')
     search_fields = ('email', 'username')
     empty_value_display = '-пусто-'
 
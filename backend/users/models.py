@@ -4,7 +4,26 @@ from django.core.validators import (MaxLengthValidator, MinLengthValidator,
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Счетчики counter_fields меняются только UPDATE с F(). При обычном
+    сохранении существующей записи они не записываются, чтобы не затереть
+    значениями, загруженными вместе с объектом, изменения из других
+    запросов.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """
     Модель пользователя.
     """
@@ -35,6 +54,16 @@ class User(AbstractUser):
         validators=(MinLengthValidator(8),
                     MaxLengthValidator(150),),
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False)
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -68,12 +97,14 @@ class Subscription(models.Model):
                                        author=self.author).exists():
             raise ValidationError('Вы уже подписаны на этого пользователя.')
 
-    def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
-
     class Meta:
         unique_together = ('user', 'author')
+        constraints = (
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='prevent_self_subscription'
+            ),
+        )
         ordering = ('user', )
         verbose_name = 'подписка'
         verbose_name_plural = 'Подписки'